@@ -13,16 +13,22 @@ A simple PyPI (Python Package Index) clone that supports:
 import os
 import re
 import json
+import zlib
+import struct
 import hashlib
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from urllib.parse import unquote
+from email.parser import Parser
+from urllib.parse import unquote, quote
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
-from flask import Flask, request, jsonify, render_template_string, send_file, abort, redirect, url_for, flash
+from flask import Flask, Response, request, jsonify, render_template_string, send_file, abort, redirect, url_for, flash
 import zipfile
 import tarfile
+from chunk_store import MANIFEST_SUFFIX
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'
@@ -33,9 +39,31 @@ PYPI_PORT = int(os.getenv('PYPI_PORT', 8080))
 PYPI_DATA_DIR = os.getenv('PYPI_DATA_DIR', './packages')
 PYPI_AUTH = os.getenv('PYPI_AUTH', 'False').lower() == 'true'
 
+# Let the front-end web server send package files instead of this process.
+# PYPI_X_SENDFILE=true emits X-Sendfile (Apache mod_xsendfile, lighttpd);
+# PYPI_X_ACCEL_REDIRECT=/_internal_packages emits an nginx X-Accel-Redirect
+# to that internal location, which must alias PYPI_DATA_DIR.
+PYPI_X_SENDFILE = os.getenv('PYPI_X_SENDFILE', 'False').lower() == 'true'
+PYPI_X_ACCEL_REDIRECT = os.getenv('PYPI_X_ACCEL_REDIRECT', '').rstrip('/')
+
+# Scanned package metadata is persisted here so restarts skip re-parsing
+PYPI_INDEX_FILE = os.getenv('PYPI_INDEX_FILE', os.path.join(PYPI_DATA_DIR, '.packages.index.json'))
+
+# Store uploads as deduplicated content-defined chunks under
+# PYPI_DATA_DIR/.chunks, with a <filename>.manifest per package (needs fastcdc)
+PYPI_CHUNK_STORE = os.getenv('PYPI_CHUNK_STORE', 'False').lower() == 'true'
+CHUNK_DIR = os.path.join(os.path.abspath(PYPI_DATA_DIR), '.chunks')
+
+app.config['USE_X_SENDFILE'] = PYPI_X_SENDFILE
+
 # Create packages directory
 os.makedirs(PYPI_DATA_DIR, exist_ok=True)
 
+CHUNK_STORE = None
+if PYPI_CHUNK_STORE:
+    from chunk_store import ChunkStore
+    CHUNK_STORE = ChunkStore(CHUNK_DIR)
+
 # Simple user store (in production, use a proper database)
 USERS = {
     'admin': generate_password_hash('admin')
@@ -48,28 +76,113 @@ def authenticate(username, password):
     user_hash = USERS.get(username)
     return user_hash and check_password_hash(user_hash, password)
 
+def package_filename(name):
+    """Return the package filename for a data dir entry (strips chunk manifests)"""
+    if CHUNK_STORE and name.endswith(MANIFEST_SUFFIX):
+        return name[:-len(MANIFEST_SUFFIX)]
+    return name
+
+def open_package(filepath):
+    """Open a package file, or the file behind a chunk manifest, for reading"""
+    if CHUNK_STORE and filepath.endswith(MANIFEST_SUFFIX):
+        return CHUNK_STORE.open(filepath)
+    return open(filepath, 'rb', buffering=WHEEL_READ_BUFFER)
+
 def get_package_metadata(filepath):
     """Extract metadata from package file"""
     try:
-        if filepath.endswith('.whl'):
+        filename = package_filename(filepath)
+        if filename.endswith('.whl'):
             return get_wheel_metadata(filepath)
-        elif filepath.endswith('.tar.gz'):
+        elif filename.endswith('.tar.gz'):
             return get_sdist_metadata(filepath)
     except Exception as e:
         print(f"Error extracting metadata from {filepath}: {e}")
     return {}
 
+# Buffer size for reading wheel archives; the central directory and the
+# METADATA member are fetched in a handful of reads instead of many small ones
+WHEEL_READ_BUFFER = 1 << 16
+
+# Zip structures used by _fast_wheel_metadata (see the PKZIP APPNOTE)
+_ZIP_EOCD = struct.Struct('<4s4H2LH')
+_ZIP_CD_ENTRY = struct.Struct('<4s6H3L5H2L')
+_ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_ZIP_TAIL_SIZE = 1 << 16
+
+def _fast_wheel_metadata(fp):
+    """Read the METADATA member of a wheel straight from the zip structures
+
+    Reads the tail of the archive once to find the end of central directory
+    record, the central directory in one more read, then only the compressed
+    METADATA bytes. Returns None for anything unusual (zip64, prefixed
+    archives, unknown compression) so the caller can fall back to zipfile.
+    """
+    size = fp.seek(0, os.SEEK_END)
+    tail_start = max(0, size - _ZIP_TAIL_SIZE)
+    fp.seek(tail_start)
+    tail = fp.read()
+    
+    eocd_pos = tail.rfind(b'PK\x05\x06')
+    if eocd_pos < 0:
+        return None
+    _, _, _, _, _, cd_size, cd_offset, _ = _ZIP_EOCD.unpack_from(tail, eocd_pos)
+    if cd_offset + cd_size != tail_start + eocd_pos:
+        return None
+    
+    if cd_offset >= tail_start:
+        cd = tail[cd_offset - tail_start:eocd_pos]
+    else:
+        fp.seek(cd_offset)
+        cd = fp.read(cd_size)
+    
+    pos = 0
+    while pos + _ZIP_CD_ENTRY.size <= len(cd):
+        (signature, _, _, flags, method, _, _, crc, compressed_size, _,
+         name_len, extra_len, comment_len, _, _, _, header_offset) = _ZIP_CD_ENTRY.unpack_from(cd, pos)
+        if signature != b'PK\x01\x02':
+            return None
+        name = cd[pos + _ZIP_CD_ENTRY.size:pos + _ZIP_CD_ENTRY.size + name_len]
+        pos += _ZIP_CD_ENTRY.size + name_len + extra_len + comment_len
+        if not name.endswith(b'.dist-info/METADATA'):
+            continue
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or flags & 0x1 or compressed_size == 0xFFFFFFFF:
+            return None
+        
+        fp.seek(header_offset)
+        header = fp.read(_ZIP_LOCAL_HEADER.size)
+        if len(header) < _ZIP_LOCAL_HEADER.size or header[:4] != b'PK\x03\x04':
+            return None
+        local_name_len, local_extra_len = _ZIP_LOCAL_HEADER.unpack(header)[-2:]
+        fp.seek(header_offset + _ZIP_LOCAL_HEADER.size + local_name_len + local_extra_len)
+        raw = fp.read(compressed_size)
+        data = zlib.decompress(raw, -15) if method == zipfile.ZIP_DEFLATED else raw
+        if zlib.crc32(data) != crc:
+            return None
+        return data.decode('utf-8')
+    return None
+
 def get_wheel_metadata(filepath):
     """Extract metadata from wheel file"""
     metadata = {}
     try:
-        with zipfile.ZipFile(filepath, 'r') as zf:
-            for name in zf.namelist():
-                if name.endswith('.dist-info/METADATA'):
-                    with zf.open(name) as f:
-                        content = f.read().decode('utf-8')
-                        metadata = parse_metadata(content)
-                    break
+        with open_package(filepath) as fp:
+            try:
+                content = _fast_wheel_metadata(fp)
+            except (struct.error, zlib.error, OSError):
+                content = None
+            if content is not None:
+                return parse_metadata(content)
+            
+            fp.seek(0)
+            with zipfile.ZipFile(fp, 'r') as zf:
+                # Only the METADATA member is decompressed, the rest is never read
+                for info in zf.infolist():
+                    if info.filename.endswith('.dist-info/METADATA'):
+                        with zf.open(info) as f:
+                            content = f.read().decode('utf-8')
+                            metadata = parse_metadata(content)
+                        break
     except Exception as e:
         print(f"Error reading wheel metadata: {e}")
     return metadata
@@ -78,8 +191,10 @@ def get_sdist_metadata(filepath):
     """Extract metadata from source distribution"""
     metadata = {}
     try:
-        with tarfile.open(filepath, 'r:gz') as tf:
-            for member in tf.getmembers():
+        # Stream the archive and stop at PKG-INFO (near the top of an sdist)
+        # rather than decompressing every member header up front
+        with open_package(filepath) as fp, tarfile.open(fileobj=fp, mode='r|gz') as tf:
+            for member in tf:
                 if member.name.endswith('/PKG-INFO'):
                     f = tf.extractfile(member)
                     if f:
@@ -90,88 +205,296 @@ def get_sdist_metadata(filepath):
         print(f"Error reading sdist metadata: {e}")
     return metadata
 
+# Core metadata header -> package info key
+METADATA_FIELDS = {
+    'Name': 'name',
+    'Version': 'version',
+    'Summary': 'summary',
+    'Author': 'author',
+    'Author-email': 'author_email',
+    'Home-page': 'home_page',
+}
+
 def parse_metadata(content):
-    """Parse package metadata from PKG-INFO format"""
-    metadata = {}
-    lines = content.split('\n')
-    
-    for line in lines:
-        if ':' in line:
-            key, value = line.split(':', 1)
-            key = key.strip()
-            value = value.strip()
-            
-            if key == 'Name':
-                metadata['name'] = value
-            elif key == 'Version':
-                metadata['version'] = value
-            elif key == 'Summary':
-                metadata['summary'] = value
-            elif key == 'Author':
-                metadata['author'] = value
-            elif key == 'Author-email':
-                metadata['author_email'] = value
-            elif key == 'Home-page':
-                metadata['home_page'] = value
-            elif key == 'Description':
-                # Description might span multiple lines
-                description_lines = [value]
-                continue
-        elif line.startswith('        ') and 'description_lines' in locals():
-            description_lines.append(line.strip())
-    
-    if 'description_lines' in locals():
-        metadata['description'] = '\n'.join(description_lines)
+    """Parse package metadata from PKG-INFO format
+
+    PKG-INFO/METADATA is an RFC 822 style header block, so the stdlib email
+    parser handles it (including folded continuation lines) in one call.
+    The long description is either the message body (Metadata 2.1+) or a
+    legacy ``Description`` header.
+    """
+    msg = Parser().parsestr(content.lstrip())
+    metadata = {
+        key: msg[field]
+        for field, key in METADATA_FIELDS.items()
+        if msg[field] is not None
+    }
+    
+    description = msg.get_payload()
+    if not description and msg['Description'] is not None:
+        description = '\n'.join(line.strip() for line in msg['Description'].splitlines())
+    if description:
+        metadata['description'] = description
     
     return metadata
 
+# Package cache: absolute path -> {'fingerprint': (size, mtime), 'name': ..., 'info': ...,
+# 'metadata': whether the METADATA/PKG-INFO fields have been merged into info}
+_PKG_CACHE = {}
+# Last package list built from the cache, grouped by lowercase name
+_PKG_INDEX = {}
+# Filename -> absolute path, used to resolve downloads without walking the tree
+_FILENAME_INDEX = {}
+_CACHE_LOCK = threading.RLock()
+# Bumped whenever the package set changes so derived data can be invalidated
+_CACHE_GEN = 0
+# Set when _PKG_CACHE was modified outside a scan (or not indexed yet)
+_INDEX_STALE = True
+
+# {name}-{version}[-{build tag}]-{python tag}-{abi tag}-{platform tag}.whl; wheel
+# names and versions never contain '-'
+_WHEEL_FILENAME_RE = re.compile(r'^(?P<name>[^-]+)-(?P<ver>[^-]+)(?:-[^-]+){3,4}\.whl$')
+
+def split_package_filename(filename):
+    """Return (name, version) for a wheel or sdist filename, or None
+
+    Sdist names may contain dashes, even before digits (python-3parclient),
+    so they are split on the last dash as the sdist naming spec requires.
+    """
+    if filename.endswith('.whl'):
+        match = _WHEEL_FILENAME_RE.match(filename)
+        return (match['name'], match['ver']) if match else None
+    if filename.endswith('.tar.gz'):
+        parts = filename[:-len('.tar.gz')].rsplit('-', 1)
+        return (parts[0], parts[1]) if len(parts) == 2 and parts[0] else None
+    return None
+
+# Metadata extraction and hashing are I/O bound and release the GIL
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def _load_index():
+    """Load the persisted package cache written by _save_index"""
+    try:
+        with open(PYPI_INDEX_FILE, 'r') as f:
+            data = json.load(f)
+        for key, entry in data.get('files', {}).items():
+            _PKG_CACHE[key] = {
+                'fingerprint': tuple(entry['fingerprint']),
+                'name': entry['name'],
+                'info': entry['info'],
+                'metadata': entry.get('metadata', False)
+            }
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error loading package index {PYPI_INDEX_FILE}: {e}")
+        _PKG_CACHE.clear()
+
+def _save_index():
+    """Persist the package cache so the next start only rescans changed files"""
+    # Per-process temp file, several workers may share one index
+    tmp_path = f"{PYPI_INDEX_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': 1, 'files': _PKG_CACHE}, f)
+        os.replace(tmp_path, PYPI_INDEX_FILE)
+    except Exception as e:
+        print(f"Error saving package index {PYPI_INDEX_FILE}: {e}")
+
+def _walk_files(root):
+    """Yield a DirEntry for every file below root
+
+    Uses os.scandir so the type and stat information gathered while reading
+    each directory is reused instead of re-statted per path. Symlinked
+    directories are not followed to avoid cycles.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        # The chunk store keeps its chunks under data_dir
+                        if not (CHUNK_STORE and entry.path == CHUNK_DIR):
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError as e:
+            print(f"Error scanning {directory}: {e}")
+
+def _package_size(file_path, stat):
+    """Size of the package itself, which for chunk manifests is recorded inside"""
+    if CHUNK_STORE and file_path.endswith(MANIFEST_SUFFIX):
+        with open(file_path, 'r') as f:
+            return json.load(f)['size']
+    return stat.st_size
+
+def _process_file(file_path, package_dir, stat, version):
+    """Build the package info for a single file
+
+    Only what the filename and the bytes provide is filled in here; the
+    richer METADATA fields are added on demand by load_rich_metadata.
+    """
+    return {
+        'filename': package_filename(os.path.basename(file_path)),
+        'path': os.path.relpath(file_path, package_dir),
+        'size': _package_size(file_path, stat),
+        'upload_time': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        'version': version,
+        'md5_digest': get_file_hash(file_path)
+    }
+
 def get_package_list():
-    """Get list of all packages"""
-    packages = {}
-    package_dir = Path(PYPI_DATA_DIR)
-    
-    for file_path in package_dir.rglob('*'):
-        if file_path.is_file() and (file_path.suffix in ['.whl', '.gz']):
+    """Get list of all packages
+
+    Files are only re-parsed and re-hashed when their size or mtime changed
+    since the previous call; untouched files are served from the cache.
+    """
+    global _PKG_INDEX, _FILENAME_INDEX, _CACHE_GEN, _INDEX_STALE
+    package_dir = os.path.abspath(PYPI_DATA_DIR)
+    
+    with _CACHE_LOCK:
+        seen = []
+        pending = []
+        
+        for entry in _walk_files(package_dir):
             # Extract package name from filename
-            filename = file_path.name
-            if filename.endswith('.whl'):
-                # wheel format: {name}-{version}-{build tag}-{language tag}-{abi tag}-{platform tag}.whl
-                name = filename.split('-')[0]
-            elif filename.endswith('.tar.gz'):
-                # sdist format: {name}-{version}.tar.gz
-                name = '-'.join(filename.replace('.tar.gz', '').split('-')[:-1])
-            else:
+            parsed = split_package_filename(package_filename(entry.name))
+            if not parsed:
                 continue
+            name = parsed[0].lower()
             
-            name = name.lower()
-            if name not in packages:
-                packages[name] = []
+            key = entry.path
+            seen.append(key)
             
             # Get file stats
-            stat = file_path.stat()
-            package_info = {
-                'filename': filename,
-                'path': str(file_path.relative_to(package_dir)),
-                'size': stat.st_size,
-                'upload_time': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                'md5_digest': get_file_hash(file_path)
-            }
+            stat = entry.stat()
+            fingerprint = (stat.st_size, stat.st_mtime)
+            cached = _PKG_CACHE.get(key)
+            if cached and cached['fingerprint'] == fingerprint:
+                continue
             
-            # Add metadata if available
-            metadata = get_package_metadata(str(file_path))
-            package_info.update(metadata)
+            pending.append((key, name, parsed[1], stat, fingerprint))
+        
+        # The index is also rebuilt after startup (files loaded from the
+        # persisted cache) and after uploads added through cache_uploaded_file
+        changed = bool(pending) or _INDEX_STALE
+        
+        # Parse and hash new or modified files concurrently
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(pending))) as executor:
+                futures = [
+                    (key, name, fingerprint, executor.submit(_process_file, key, package_dir, stat, version))
+                    for key, name, version, stat, fingerprint in pending
+                ]
             
-            packages[name].append(package_info)
-    
-    return packages
+            for key, name, fingerprint, future in futures:
+                _PKG_CACHE[key] = {
+                    'fingerprint': fingerprint,
+                    'name': name,
+                    'info': future.result(),
+                    'metadata': False
+                }
+        
+        # Drop entries for files that no longer exist
+        for key in set(_PKG_CACHE) - set(seen):
+            del _PKG_CACHE[key]
+            changed = True
+        
+        if changed:
+            packages = {}
+            filenames = {}
+            for key in seen:
+                entry = _PKG_CACHE[key]
+                packages.setdefault(entry['name'], []).append(entry['info'])
+                filenames.setdefault(entry['info']['filename'], key)
+            _PKG_INDEX = packages
+            _FILENAME_INDEX = filenames
+            _CACHE_GEN += 1
+            _INDEX_STALE = False
+            _save_index()
+        
+        return _PKG_INDEX
+
+def cache_uploaded_file(file_path, md5_digest):
+    """Add a freshly written package to the cache without re-reading it for hashing"""
+    global _INDEX_STALE
+    key = os.path.abspath(file_path)
+    filename = package_filename(os.path.basename(key))
+    parsed = split_package_filename(filename)
+    if not parsed:
+        return
+    
+    stat = os.stat(key)
+    package_info = {
+        'filename': filename,
+        'path': os.path.relpath(key, os.path.abspath(PYPI_DATA_DIR)),
+        'size': _package_size(key, stat),
+        'upload_time': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        'version': parsed[1],
+        'md5_digest': md5_digest
+    }
+    package_info.update(get_package_metadata(key))
+    
+    with _CACHE_LOCK:
+        _PKG_CACHE[key] = {
+            'fingerprint': (stat.st_size, stat.st_mtime),
+            'name': parsed[0].lower(),
+            'info': package_info,
+            'metadata': True
+        }
+        _INDEX_STALE = True
+
+def load_rich_metadata(names=None):
+    """Merge METADATA/PKG-INFO fields into the cached info of the given packages
+
+    The simple API only needs filenames and digests, so archives are opened
+    lazily, the first time a view needs summaries, authors and so on.
+    Parsed metadata is kept in the cache. With names=None every package
+    is loaded.
+    """
+    with _CACHE_LOCK:
+        missing = [
+            key for key, entry in _PKG_CACHE.items()
+            if not entry['metadata'] and (names is None or entry['name'] in names)
+        ]
+        if not missing:
+            return
+        
+        with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(missing))) as executor:
+            results = list(executor.map(get_package_metadata, missing))
+        
+        for key, metadata in zip(missing, results):
+            _PKG_CACHE[key]['info'].update(metadata)
+            _PKG_CACHE[key]['metadata'] = True
+        _save_index()
+
+_load_index()
+
+# Read size used when hashing package files
+HASH_CHUNK_SIZE = 1 << 20
 
 def get_file_hash(filepath):
-    """Calculate MD5 hash of file"""
-    hash_md5 = hashlib.md5()
+    """Calculate MD5 hash of file
+
+    MD5 is kept (rather than a faster digest) because it is published as the
+    ``#md5=`` fragment on the simple index, which pip verifies on download.
+    """
     try:
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
+        with open_package(str(filepath)) as f:
+            if hasattr(hashlib, 'file_digest'):
+                return hashlib.file_digest(f, 'md5').hexdigest()
+            
+            # Python < 3.11: reuse one buffer instead of allocating per chunk
+            hash_md5 = hashlib.md5()
+            buffer = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buffer)
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                hash_md5.update(view[:size])
         return hash_md5.hexdigest()
     except Exception:
         return ""
@@ -180,59 +503,84 @@ def get_file_hash(filepath):
 def index():
     """Main web interface"""
     packages = get_package_list()
+    load_rich_metadata()
     return render_template_string(INDEX_TEMPLATE, packages=packages)
 
+# Rendered simple API pages, tagged with the cache generation they were built from;
+# the per-package pages are dropped together when the generation changes
+_SIMPLE_INDEX_HTML = (-1, '')
+_SIMPLE_PACKAGE_HTML = {'generation': -1, 'pages': {}}
+SIMPLE_CACHE_MAX_PAGES = 4096
+
 @app.route('/simple/')
 def simple_index():
     """PyPI simple API - package index"""
-    packages = get_package_list()
+    global _SIMPLE_INDEX_HTML
+    with _CACHE_LOCK:
+        packages = get_package_list()
+        current = _CACHE_GEN
+    
+    generation, html = _SIMPLE_INDEX_HTML
+    if generation == current:
+        return html
+    
     package_names = sorted(packages.keys())
+    links = '\n'.join(f'    <a href="/simple/{name}/">{name}</a><br>' for name in package_names)
     
-    html = """<!DOCTYPE html>
+    html = f"""<!DOCTYPE html>
 <html>
 <head>
     <title>Simple index</title>
 </head>
 <body>
     <h1>Simple index</h1>
-"""
-    
-    for name in package_names:
-        html += f'    <a href="/simple/{name}/">{name}</a><br>\n'
-    
-    html += """</body>
+{links}
+</body>
 </html>"""
     
+    _SIMPLE_INDEX_HTML = (current, html)
     return html
 
 @app.route('/simple/<package_name>/')
 def simple_package(package_name):
     """PyPI simple API - package versions"""
-    packages = get_package_list()
+    with _CACHE_LOCK:
+        packages = get_package_list()
+        current = _CACHE_GEN
     package_name_lower = package_name.lower()
     
     if package_name_lower not in packages:
         abort(404)
     
+    # Keyed by the lowercase name, so case variants share one entry
+    if _SIMPLE_PACKAGE_HTML['generation'] != current:
+        _SIMPLE_PACKAGE_HTML['generation'] = current
+        _SIMPLE_PACKAGE_HTML['pages'] = {}
+    pages = _SIMPLE_PACKAGE_HTML['pages']
+    html = pages.get(package_name_lower)
+    if html is not None:
+        return html
+    
     package_files = packages[package_name_lower]
+    links = '\n'.join(
+        f'    <a href="/packages/{file_info["filename"]}#md5={file_info.get("md5_digest", "")}">{file_info["filename"]}</a><br>'
+        for file_info in package_files
+    )
     
     html = f"""<!DOCTYPE html>
 <html>
 <head>
-    <title>Links for {package_name}</title>
+    <title>Links for {package_name_lower}</title>
 </head>
 <body>
-    <h1>Links for {package_name}</h1>
-"""
-    
-    for file_info in package_files:
-        filename = file_info['filename']
-        md5_hash = file_info.get('md5_digest', '')
-        html += f'    <a href="/packages/{filename}#md5={md5_hash}">{filename}</a><br>\n'
-    
-    html += """</body>
+    <h1>Links for {package_name_lower}</h1>
+{links}
+</body>
 </html>"""
     
+    if len(pages) >= SIMPLE_CACHE_MAX_PAGES:
+        pages.clear()
+    pages[package_name_lower] = html
     return html
 
 @app.route('/packages/<filename>')
@@ -241,13 +589,38 @@ def download_package(filename):
     filename = secure_filename(filename)
     file_path = Path(PYPI_DATA_DIR) / filename
     
-    # Also check in subdirectories
+    # Also check in subdirectories, using the index built by get_package_list
+    if CHUNK_STORE and not file_path.exists():
+        file_path = file_path.with_name(filename + MANIFEST_SUFFIX)
     if not file_path.exists():
-        for file_path in Path(PYPI_DATA_DIR).rglob(filename):
-            if file_path.is_file():
-                break
-        else:
+        indexed_path = _FILENAME_INDEX.get(filename) if _PKG_CACHE and not _INDEX_STALE else None
+        if not indexed_path or not os.path.isfile(indexed_path):
+            # Not indexed yet, or copied into the tree since the last scan;
+            # the rescan only stats the files that are already cached
+            get_package_list()
+            indexed_path = _FILENAME_INDEX.get(filename)
+        if not indexed_path or not os.path.isfile(indexed_path):
             abort(404)
+        file_path = Path(indexed_path)
+    
+    # Chunked packages are reassembled on the fly
+    if CHUNK_STORE and file_path.name.endswith(MANIFEST_SUFFIX):
+        return send_file(
+            CHUNK_STORE.open(str(file_path)),
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name=filename
+        )
+    
+    if PYPI_X_ACCEL_REDIRECT:
+        rel_path = os.path.relpath(file_path, PYPI_DATA_DIR).replace(os.sep, '/')
+        return Response(
+            content_type='application/octet-stream',
+            headers={
+                'X-Accel-Redirect': f'{PYPI_X_ACCEL_REDIRECT}/{quote(rel_path)}',
+                'Content-Disposition': f'attachment; filename="{filename}"'
+            }
+        )
     
     return send_file(str(file_path), as_attachment=True)
 
@@ -278,35 +651,90 @@ def upload_package():
     # Create directory if it doesn't exist
     file_path.parent.mkdir(parents=True, exist_ok=True)
     
+    manifest_path = file_path.with_name(filename + MANIFEST_SUFFIX)
+    
     # Check if file already exists
-    if file_path.exists():
+    if file_path.exists() or manifest_path.exists():
         return jsonify({'error': 'File already exists'}), 409
     
-    file.save(str(file_path))
+    # With the chunk store the upload is spooled to a hidden temp file and
+    # only its new chunks are kept
+    write_path = file_path
+    if CHUNK_STORE:
+        write_path = file_path.with_name(f".{filename}.{os.getpid()}.upload")
+    
+    # Hash while writing so the file never has to be read back for its digest
+    hash_md5 = hashlib.md5()
+    with open(write_path, 'wb') as out:
+        while True:
+            chunk = file.stream.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            hash_md5.update(chunk)
+            out.write(chunk)
+    
+    if CHUNK_STORE:
+        try:
+            CHUNK_STORE.store(write_path, manifest_path)
+        finally:
+            os.unlink(write_path)
+        file_path = manifest_path
+    
+    cache_uploaded_file(file_path, hash_md5.hexdigest())
     
     return jsonify({'message': 'Package uploaded successfully', 'filename': filename}), 200
 
+# Trigram -> names of packages containing it, tagged with its cache generation
+_TRIGRAM_INDEX = (-1, {})
+
+def _trigrams(text):
+    """Return the set of 3-character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _search_candidates(packages, query, generation):
+    """Narrow the package names that can contain query using the trigram index"""
+    global _TRIGRAM_INDEX
+    if len(query) < 3:
+        return packages.keys()
+    
+    index_generation, index = _TRIGRAM_INDEX
+    if index_generation != generation:
+        index = {}
+        for name in packages:
+            for trigram in _trigrams(name):
+                index.setdefault(trigram, set()).add(name)
+        _TRIGRAM_INDEX = (generation, index)
+    
+    posting_lists = sorted((index.get(trigram, set()) for trigram in _trigrams(query)), key=len)
+    return set.intersection(*posting_lists)
+
 @app.route('/search')
 def search_packages():
     """Search packages"""
     query = request.args.get('q', '').lower()
-    packages = get_package_list()
+    with _CACHE_LOCK:
+        packages = get_package_list()
+        current = _CACHE_GEN
     
     if not query:
         return jsonify({'packages': []})
     
+    # Trigram hits are only candidates; confirm the substring match
+    matches = [name for name in sorted(_search_candidates(packages, query, current)) if query in name]
+    load_rich_metadata(set(matches))
+    
     results = []
-    for name, files in packages.items():
-        if query in name.lower():
-            # Get latest version
-            latest_file = max(files, key=lambda x: x.get('upload_time', ''))
-            results.append({
-                'name': name,
-                'version': latest_file.get('version', 'unknown'),
-                'summary': latest_file.get('summary', ''),
-                'author': latest_file.get('author', ''),
-                'home_page': latest_file.get('home_page', '')
-            })
+    for name in matches:
+        files = packages[name]
+        # Get latest version
+        latest_file = max(files, key=lambda x: x.get('upload_time', ''))
+        results.append({
+            'name': name,
+            'version': latest_file.get('version', 'unknown'),
+            'summary': latest_file.get('summary', ''),
+            'author': latest_file.get('author', ''),
+            'home_page': latest_file.get('home_page', '')
+        })
     
     return jsonify({'packages': results})
 
@@ -314,6 +742,7 @@ def search_packages():
 def api_packages():
     """API endpoint to get all packages"""
     packages = get_package_list()
+    load_rich_metadata()
     return jsonify(packages)
 
 @app.route('/api/packages/<package_name>')
@@ -325,6 +754,7 @@ def api_package_info(package_name):
     if package_name_lower not in packages:
         return jsonify({'error': 'Package not found'}), 404
     
+    load_rich_metadata({package_name_lower})
     return jsonify({
         'name': package_name,
         'files': packages[package_name_lower]
@@ -442,5 +872,7 @@ if __name__ == '__main__':
     print(f"Starting PyPI Clone server on http://{PYPI_HOST}:{PYPI_PORT}")
     print(f"Package directory: {os.path.abspath(PYPI_DATA_DIR)}")
     print(f"Authentication: {'Enabled' if PYPI_AUTH else 'Disabled'}")
+    print("For production use: gunicorn -c gunicorn_conf.py app:app")
     
-    app.run(host=PYPI_HOST, port=PYPI_PORT, debug=True)
+    # The Werkzeug debugger and reloader are only enabled for development
+    app.run(host=PYPI_HOST, port=PYPI_PORT, debug=os.getenv('FLASK_DEV', 'False').lower() == 'true')
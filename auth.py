@@ -3,13 +3,72 @@
 Authentication and user management for PyPI Clone
 """
 
+import os
 import json
+import time
+import atexit
 import hashlib
 import secrets
+import threading
+from functools import lru_cache
 from pathlib import Path
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# werkzeug password hashing method, e.g. 'scrypt:16384:8:1' for cheaper
+# logins and account creation; empty means werkzeug's default, which is
+# pbkdf2:sha256:600000 in the pinned 2.3.7 and scrypt:32768:8:1 from 3.0
+PASSWORD_HASH_METHOD = os.getenv('PYPI_PASSWORD_HASH_METHOD', '')
+
+def hash_password(password):
+    """Hash a password with the configured method"""
+    if PASSWORD_HASH_METHOD:
+        return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+    return generate_password_hash(password)
+
+# (epoch second, ISO string) for the last formatted timestamp
+_NOW_ISO = (0, '')
+
+def now_iso():
+    """Current local time as an ISO 8601 string, at one-second resolution
+
+    The string is only re-formatted when the second changes, so bursts of
+    logins and token checks share one datetime/isoformat call.
+    """
+    global _NOW_ISO
+    second = int(time.time())
+    if _NOW_ISO[0] != second:
+        _NOW_ISO = (second, datetime.fromtimestamp(second).isoformat())
+    return _NOW_ISO[1]
+
+def hash_token(token):
+    """Return the key under which an API token is stored"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _is_token_hash(key):
+    """Check whether a tokens key is already a SHA-256 hex digest"""
+    return len(key) == 64 and all(c in '0123456789abcdef' for c in key)
+
+@lru_cache(maxsize=8)
+def _load_users(path, mtime, size):
+    """Parse a users file; cached per (path, mtime, size) so repeated
+    UserManager instances only re-read it after it changes"""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r') as f:
+        return json.load(f)
+
+# Login bookkeeping (last_login, expired token cleanup) is written by a
+# background timer at most this many seconds after it happens, never by
+# the request itself; explicit changes are always written immediately
+FLUSH_INTERVAL = 5
+
 class UserManager:
     """Manages users and authentication"""
     
@@ -17,16 +76,31 @@ class UserManager:
         self.user_file = Path(user_file)
         self.users = {}
         self.tokens = {}  # API tokens
+        self._dirty = False
+        self._save_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer = None
         self.load_users()
+        atexit.register(self.flush)
     
     def load_users(self):
         """Load users from file"""
         if self.user_file.exists():
             try:
-                with open(self.user_file, 'r') as f:
-                    data = json.load(f)
-                    self.users = data.get('users', {})
-                    self.tokens = data.get('tokens', {})
+                stat = self.user_file.stat()
+                data = _load_users(str(self.user_file), stat.st_mtime_ns, stat.st_size)
+                # Per-entry copies: the parsed data is shared through the cache
+                self.users = {username: dict(user) for username, user in data.get('users', {}).items()}
+                self.tokens = {key: dict(info) for key, info in data.get('tokens', {}).items()}
+                
+                # Older user files stored raw tokens as keys; re-key them by hash
+                legacy_tokens = [key for key in self.tokens if not _is_token_hash(key)]
+                for token in legacy_tokens:
+                    info = self.tokens.pop(token)
+                    info.setdefault('prefix', token[:8])
+                    self.tokens[hash_token(token)] = info
+                if legacy_tokens:
+                    self.save_users()
             except Exception as e:
                 print(f"Error loading users: {e}")
                 self.users = {}
@@ -38,26 +112,56 @@ class UserManager:
     
     def save_users(self):
         """Save users to file"""
-        data = {
-            'users': self.users,
-            'tokens': self.tokens
-        }
+        tmp_file = f"{self.user_file}.{os.getpid()}.tmp"
         try:
-            with open(self.user_file, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
+            with self._save_lock:
+                # Snapshot under the lock, so a flush that started earlier
+                # can never write its older copy over a newer explicit save;
+                # shallow copies, as request threads may add or drop entries
+                # while it is writing. Changes marked after this point stay
+                # dirty for the next flush.
+                self._dirty = False
+                data = {
+                    'users': dict(self.users),
+                    'tokens': dict(self.tokens)
+                }
+                with open(tmp_file, 'w') as f:
+                    json.dump(data, f, indent=2, default=str)
+                # Readers in other processes never see a half-written file
+                os.replace(tmp_file, self.user_file)
         except Exception as e:
             print(f"Error saving users: {e}")
     
+    def flush(self):
+        """Write pending bookkeeping changes, if any"""
+        if self._dirty:
+            self.save_users()
+    
+    def _mark_dirty(self):
+        """Record a low-priority change for the background flush"""
+        self._dirty = True
+        with self._flush_lock:
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(FLUSH_INTERVAL, self._timed_flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def _timed_flush(self):
+        """Timer callback: write the changes collected since _mark_dirty()"""
+        with self._flush_lock:
+            self._flush_timer = None
+        self.flush()
+    
     def create_user(self, username, password, email=None, is_admin=False):
         """Create a new user"""
         if username in self.users:
             raise ValueError(f"User {username} already exists")
         
         self.users[username] = {
-            'password_hash': generate_password_hash(password),
+            'password_hash': hash_password(password),
             'email': email or '',
             'is_admin': is_admin,
-            'created_at': datetime.now().isoformat(),
+            'created_at': now_iso(),
             'last_login': None,
             'active': True
         }
@@ -72,15 +176,20 @@ class UserManager:
         
         if check_password_hash(user['password_hash'], password):
             # Update last login
-            user['last_login'] = datetime.now().isoformat()
-            self.save_users()
+            user['last_login'] = now_iso()
+            self._mark_dirty()
             return True
         
         return False
     
     def authenticate_token(self, token):
-        """Authenticate user with API token"""
-        token_info = self.tokens.get(token)
+        """Authenticate user with API token
+
+        Tokens are looked up by their SHA-256 digest, so neither the dict
+        lookup nor users.json ever handles the secret itself.
+        """
+        key = hash_token(token)
+        token_info = self.tokens.get(key)
         if not token_info:
             return None
         
@@ -88,8 +197,8 @@ class UserManager:
         if token_info.get('expires_at'):
             expires_at = datetime.fromisoformat(token_info['expires_at'])
             if datetime.now() > expires_at:
-                del self.tokens[token]
-                self.save_users()
+                del self.tokens[key]
+                self._mark_dirty()
                 return None
         
         username = token_info['username']
@@ -109,10 +218,11 @@ class UserManager:
         if expires_days:
             expires_at = (datetime.now() + timedelta(days=expires_days)).isoformat()
         
-        self.tokens[token] = {
+        self.tokens[hash_token(token)] = {
             'username': username,
+            'prefix': token[:8],
             'name': name or f"Token for {username}",
-            'created_at': datetime.now().isoformat(),
+            'created_at': now_iso(),
             'expires_at': expires_at,
             'last_used': None
         }
@@ -121,8 +231,9 @@ class UserManager:
     
     def revoke_token(self, token):
         """Revoke an API token"""
-        if token in self.tokens:
-            del self.tokens[token]
+        key = hash_token(token)
+        if key in self.tokens:
+            del self.tokens[key]
             self.save_users()
             return True
         return False
@@ -130,10 +241,10 @@ class UserManager:
     def list_tokens(self, username):
         """List all tokens for a user"""
         user_tokens = []
-        for token, info in self.tokens.items():
+        for info in self.tokens.values():
             if info['username'] == username:
                 user_tokens.append({
-                    'token': token[:8] + '...',  # Partial token for security
+                    'token': info.get('prefix', '') + '...',  # Partial token for security
                     'name': info['name'],
                     'created_at': info['created_at'],
                     'expires_at': info.get('expires_at'),
@@ -146,7 +257,7 @@ class UserManager:
         if not self.authenticate(username, old_password):
             raise ValueError("Invalid current password")
         
-        self.users[username]['password_hash'] = generate_password_hash(new_password)
+        self.users[username]['password_hash'] = hash_password(new_password)
         self.save_users()
         return True
     
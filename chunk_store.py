@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Content-defined chunk storage for PyPI Clone
+
+Package files are split with FastCDC into variable-size chunks that are
+stored once under their SHA-256, so successive releases of large wheels
+only add the chunks that actually changed. Each package is represented by
+a small JSON manifest listing its chunks in order.
+
+Requires the optional ``fastcdc`` package.
+"""
+
+import io
+import os
+import json
+import bisect
+import hashlib
+from pathlib import Path
+
+try:
+    from fastcdc import fastcdc
+except ImportError:
+    fastcdc = None
+
+MANIFEST_SUFFIX = '.manifest'
+
+class ChunkStore:
+    """Stores files as deduplicated content-defined chunks"""
+
+    def __init__(self, chunk_dir, avg_chunk_size=64 * 1024):
+        if fastcdc is None:
+            raise RuntimeError("The chunk store requires the 'fastcdc' package (pip install fastcdc)")
+        self.chunk_dir = Path(chunk_dir)
+        self.chunk_dir.mkdir(parents=True, exist_ok=True)
+        self.avg_chunk_size = avg_chunk_size
+
+    def _chunk_path(self, digest):
+        """Chunks are fanned out over 256 subdirectories by digest prefix"""
+        return self.chunk_dir / digest[:2] / digest
+
+    def store(self, source_path, manifest_path):
+        """Chunk source_path into the store and write its manifest
+
+        Only chunks that are not stored yet are written. Returns the manifest.
+        """
+        chunks = []
+        total_size = 0
+
+        for chunk in fastcdc(str(source_path), avg_size=self.avg_chunk_size, fat=True, hf=hashlib.sha256):
+            chunk_path = self._chunk_path(chunk.hash)
+            if not chunk_path.exists():
+                chunk_path.parent.mkdir(exist_ok=True)
+                tmp_path = chunk_path.with_name(f"{chunk.hash}.{os.getpid()}.tmp")
+                with open(tmp_path, 'wb') as f:
+                    f.write(chunk.data)
+                os.replace(tmp_path, chunk_path)
+            chunks.append([chunk.hash, chunk.length])
+            total_size += chunk.length
+
+        manifest = {'size': total_size, 'chunks': chunks}
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+        return manifest
+
+    def open(self, manifest_path):
+        """Open a stored file for reading through its manifest"""
+        return io.BufferedReader(ChunkedReader(self, load_manifest(manifest_path)), buffer_size=1 << 16)
+
+def load_manifest(manifest_path):
+    """Read a chunk manifest"""
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+class ChunkedReader(io.RawIOBase):
+    """Seekable, read-only view of a file reassembled from its chunks"""
+
+    def __init__(self, store, manifest):
+        self.store = store
+        self.chunks = manifest['chunks']
+        self.size = manifest['size']
+        # Start offset of every chunk, for bisecting seek positions
+        self.offsets = []
+        offset = 0
+        for _, length in self.chunks:
+            self.offsets.append(offset)
+            offset += length
+        self.position = 0
+        self._current = None  # (chunk index, open file)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError("Negative seek position")
+        self.position = position
+        return position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+
+        index = bisect.bisect_right(self.offsets, self.position) - 1
+        digest, length = self.chunks[index]
+        if self._current is None or self._current[0] != index:
+            self._close_current()
+            self._current = (index, open(self.store._chunk_path(digest), 'rb'))
+
+        chunk_file = self._current[1]
+        chunk_offset = self.position - self.offsets[index]
+        chunk_file.seek(chunk_offset)
+
+        view = memoryview(buffer)
+        size = chunk_file.readinto(view[:min(len(view), length - chunk_offset)])
+        self.position += size
+        return size
+
+    def _close_current(self):
+        if self._current is not None:
+            self._current[1].close()
+            self._current = None
+
+    def close(self):
+        self._close_current()
+        super().close()
@@ -13,8 +13,11 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from config import Config, create_sample_config
-from package_manager import PackageManager
-from auth import UserManager
+
+def write_lines(lines):
+    """Write a report with a single write() instead of one print() per line"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+    sys.stdout.flush()
 
 def cmd_start(args):
     """Start the PyPI server"""
@@ -51,6 +54,8 @@ def cmd_init(args):
 
 def cmd_user(args):
     """User management commands"""
+    from auth import UserManager
+    
     user_manager = UserManager(args.user_file or 'users.json')
     
     if args.user_action == 'create':
@@ -69,14 +74,14 @@ def cmd_user(args):
     
     elif args.user_action == 'list':
         users = user_manager.list_users()
-        print(f"{'Username':<20} {'Email':<30} {'Admin':<8} {'Active':<8} {'Created'}")
-        print("-" * 80)
+        lines = [f"{'Username':<20} {'Email':<30} {'Admin':<8} {'Active':<8} {'Created'}", "-" * 80]
         for username, user in users.items():
             admin_str = "Yes" if user.get('is_admin') else "No"
             active_str = "Yes" if user.get('active', True) else "No"
             created = user.get('created_at', '')[:10]
             email = user.get('email', '')[:30]
-            print(f"{username:<20} {email:<30} {admin_str:<8} {active_str:<8} {created}")
+            lines.append(f"{username:<20} {email:<30} {admin_str:<8} {active_str:<8} {created}")
+        write_lines(lines)
         return 0
     
     elif args.user_action == 'delete':
@@ -104,52 +109,48 @@ def cmd_user(args):
 
 def cmd_stats(args):
     """Show server statistics"""
+    from package_manager import PackageManager
+    
     config = Config()
     package_manager = PackageManager(config.data_dir)
     
-    packages = package_manager.get_all_packages()
-    stats = package_manager.get_package_stats()
+    # Counts and recent files come from the directory listing only
+    stats = package_manager.get_package_stats_fast(recent=5)
     
-    print("📊 PyPI Clone Statistics")
-    print("=" * 30)
-    print(f"Packages: {stats['total_packages']}")
-    print(f"Files: {stats['total_files']}")
-    print(f"Total size: {stats['total_size_mb']} MB")
-    print(f"Data directory: {config.data_dir}")
+    lines = [
+        "📊 PyPI Clone Statistics",
+        "=" * 30,
+        f"Packages: {stats['total_packages']}",
+        f"Files: {stats['total_files']}",
+        f"Total size: {stats['total_size_mb']} MB",
+        f"Data directory: {config.data_dir}"
+    ]
     
-    if packages:
-        print("\n📦 Recent packages:")
+    if stats['recent']:
+        lines.append("\n📦 Recent packages:")
         # Show 5 most recent packages
-        all_files = []
-        for name, versions in packages.items():
-            for version in versions:
-                all_files.append((name, version))
-        
-        all_files.sort(key=lambda x: x[1].get('upload_time', ''), reverse=True)
-        
-        for name, file_info in all_files[:5]:
-            version = file_info.get('version', 'unknown')
-            upload_time = file_info.get('upload_time', '')
-            if hasattr(upload_time, 'strftime'):
-                upload_time = upload_time.strftime('%Y-%m-%d %H:%M')
-            print(f"  • {name} {version} ({upload_time})")
+        for name, version, upload_time in stats['recent']:
+            upload_time = upload_time.strftime('%Y-%m-%d %H:%M')
+            lines.append(f"  • {name} {version or 'unknown'} ({upload_time})")
     
+    write_lines(lines)
     return 0
 
 def cmd_packages(args):
     """Package management commands"""
+    from package_manager import PackageManager
+    
     config = Config()
     package_manager = PackageManager(config.data_dir)
     
     if args.package_action == 'list':
-        packages = package_manager.get_all_packages()
+        packages = package_manager.get_all_packages(include_hashes=False)
         
         if not packages:
             print("No packages found.")
             return 0
         
-        print(f"{'Package':<30} {'Version':<15} {'Files':<8} {'Size (KB)':<12} {'Uploaded'}")
-        print("-" * 85)
+        lines = [f"{'Package':<30} {'Version':<15} {'Files':<8} {'Size (KB)':<12} {'Uploaded'}", "-" * 85]
         
         for name, versions in packages.items():
             latest = versions[0] if versions else {}
@@ -159,8 +160,9 @@ def cmd_packages(args):
             if hasattr(upload_time, 'strftime'):
                 upload_time = upload_time.strftime('%Y-%m-%d')
             
-            print(f"{name:<30} {version:<15} {len(versions):<8} {size_kb:<12} {upload_time}")
+            lines.append(f"{name:<30} {version:<15} {len(versions):<8} {size_kb:<12} {upload_time}")
         
+        write_lines(lines)
         return 0
     
     elif args.package_action == 'search':
@@ -171,22 +173,22 @@ def cmd_packages(args):
             print(f"No packages found matching '{query}'")
             return 0
         
-        print(f"Found {len(results)} package(s) matching '{query}':")
-        print()
+        lines = [f"Found {len(results)} package(s) matching '{query}':", ""]
         
         for pkg in results:
-            print(f"📦 {pkg['name']} ({pkg['latest_version']})")
+            lines.append(f"📦 {pkg['name']} ({pkg['latest_version']})")
             if pkg['summary']:
-                print(f"   {pkg['summary']}")
+                lines.append(f"   {pkg['summary']}")
             if pkg['author']:
-                print(f"   Author: {pkg['author']}")
-            print()
+                lines.append(f"   Author: {pkg['author']}")
+            lines.append("")
         
+        write_lines(lines)
         return 0
     
     elif args.package_action == 'info':
         package_name = args.package_name or input("Package name: ")
-        packages = package_manager.get_all_packages()
+        packages = package_manager.get_all_packages(include_hashes=False)
         
         if package_name.lower() not in packages:
             print(f"Package '{package_name}' not found.")
@@ -195,31 +197,29 @@ def cmd_packages(args):
         versions = packages[package_name.lower()]
         latest = versions[0] if versions else {}
         
-        print(f"📦 Package Information: {package_name}")
-        print("=" * 50)
-        print(f"Latest version: {latest.get('version', 'unknown')}")
-        print(f"Summary: {latest.get('summary', 'No description')}")
-        print(f"Author: {latest.get('author', 'Unknown')}")
-        print(f"Home page: {latest.get('home_page', 'Not specified')}")
-        print(f"Total versions: {len(versions)}")
-        
-        print("\n📁 Available files:")
+        lines = [
+            f"📦 Package Information: {package_name}",
+            "=" * 50,
+            f"Latest version: {latest.get('version', 'unknown')}",
+            f"Summary: {latest.get('summary', 'No description')}",
+            f"Author: {latest.get('author', 'Unknown')}",
+            f"Home page: {latest.get('home_page', 'Not specified')}",
+            f"Total versions: {len(versions)}",
+            "\n📁 Available files:"
+        ]
         for version in versions:
             filename = version.get('filename', 'unknown')
             size_kb = round(version.get('size', 0) / 1024, 1)
             upload_time = version.get('upload_time', '')
             if hasattr(upload_time, 'strftime'):
                 upload_time = upload_time.strftime('%Y-%m-%d %H:%M')
-            print(f"  • {filename} ({size_kb} KB, {upload_time})")
+            lines.append(f"  • {filename} ({size_kb} KB, {upload_time})")
         
+        write_lines(lines)
         return 0
 
-def main():
-    """Main CLI entry point"""
-    parser = argparse.ArgumentParser(description="PyPI Clone server management")
-    subparsers = parser.add_subparsers(dest='command', help='Available commands')
-    
-    # Start server command
+def add_start_parser(subparsers):
+    """Start server command"""
     start_parser = subparsers.add_parser('start', help='Start the PyPI server')
     start_parser.add_argument('--host', help='Host to bind to')
     start_parser.add_argument('--port', type=int, help='Port to bind to')
@@ -227,14 +227,16 @@ def main():
     start_parser.add_argument('--auth', action='store_true', help='Enable authentication')
     start_parser.add_argument('--debug', action='store_true', help='Enable debug mode')
     start_parser.set_defaults(func=cmd_start)
-    
-    # Initialize command
+
+def add_init_parser(subparsers):
+    """Initialize command"""
     init_parser = subparsers.add_parser('init', help='Initialize configuration')
     init_parser.add_argument('--config', help='Configuration file path')
     init_parser.add_argument('--force', action='store_true', help='Overwrite existing config')
     init_parser.set_defaults(func=cmd_init)
-    
-    # User management
+
+def add_user_parser(subparsers):
+    """User management"""
     user_parser = subparsers.add_parser('user', help='User management')
     user_subparsers = user_parser.add_subparsers(dest='user_action', help='User actions')
     
@@ -263,12 +265,14 @@ def main():
     token_parser.add_argument('--user-file', help='User database file')
     
     user_parser.set_defaults(func=cmd_user)
-    
-    # Statistics
+
+def add_stats_parser(subparsers):
+    """Statistics"""
     stats_parser = subparsers.add_parser('stats', help='Show server statistics')
     stats_parser.set_defaults(func=cmd_stats)
-    
-    # Package management
+
+def add_packages_parser(subparsers):
+    """Package management"""
     packages_parser = subparsers.add_parser('packages', help='Package management')
     packages_subparsers = packages_parser.add_subparsers(dest='package_action', help='Package actions')
     
@@ -284,6 +288,30 @@ def main():
     info_packages_parser.add_argument('--package-name', help='Package name')
     
     packages_parser.set_defaults(func=cmd_packages)
+
+# Command name -> function adding its subparser
+COMMANDS = {
+    'start': add_start_parser,
+    'init': add_init_parser,
+    'user': add_user_parser,
+    'stats': add_stats_parser,
+    'packages': add_packages_parser,
+}
+
+def build_parser(commands=COMMANDS):
+    """Build the argument parser with subparsers for the given commands"""
+    parser = argparse.ArgumentParser(description="PyPI Clone server management")
+    subparsers = parser.add_subparsers(dest='command', help='Available commands')
+    for command in commands:
+        COMMANDS[command](subparsers)
+    return parser
+
+def main():
+    """Main CLI entry point"""
+    # Only build the subparser of the command being run; help and unknown
+    # commands get the full tree so usage and errors list every command
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    parser = build_parser([command] if command in COMMANDS else COMMANDS)
     
     args = parser.parse_args()
     
@@ -5,8 +5,37 @@ Configuration and utilities for PyPI Clone server
 
 import os
 import configparser
+from types import MappingProxyType
+from functools import lru_cache
 from pathlib import Path
 
+@lru_cache(maxsize=4)
+def _read_config_file(config_file, mtime):
+    """Parse the settings present in a config file
+    
+    Cached per (path, mtime), so repeated Config() instances in one
+    process only read and parse the file again after it changes.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    settings = {}
+    
+    if 'server' in config:
+        server_config = config['server']
+        for key in ('host', 'data_dir', 'secret_key'):
+            if key in server_config:
+                settings[key] = server_config.get(key)
+        for key in ('port', 'max_file_size'):
+            if key in server_config:
+                settings[key] = server_config.getint(key)
+        if 'debug' in server_config:
+            settings['debug'] = server_config.getboolean('debug')
+    
+    if 'auth' in config and 'enabled' in config['auth']:
+        settings['auth_enabled'] = config['auth'].getboolean('enabled')
+    
+    return MappingProxyType(settings)
+
 class Config:
     """Configuration class for PyPI server"""
     
@@ -26,22 +55,13 @@ class Config:
         self.max_file_size = 100 * 1024 * 1024  # 100MB
         
         # Load from config file if exists
-        if os.path.exists(self.config_file):
-            config = configparser.ConfigParser()
-            config.read(self.config_file)
-            
-            if 'server' in config:
-                server_config = config['server']
-                self.host = server_config.get('host', self.host)
-                self.port = server_config.getint('port', self.port)
-                self.data_dir = server_config.get('data_dir', self.data_dir)
-                self.debug = server_config.getboolean('debug', self.debug)
-                self.secret_key = server_config.get('secret_key', self.secret_key)
-                self.max_file_size = server_config.getint('max_file_size', self.max_file_size)
-            
-            if 'auth' in config:
-                auth_config = config['auth']
-                self.auth_enabled = auth_config.getboolean('enabled', self.auth_enabled)
+        try:
+            mtime = os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None:
+            for key, value in _read_config_file(self.config_file, mtime).items():
+                setattr(self, key, value)
         
         # Override with environment variables
         self.host = os.getenv('PYPI_HOST', self.host)
@@ -51,8 +71,19 @@ class Config:
         self.debug = os.getenv('PYPI_DEBUG', str(self.debug)).lower() == 'true'
         self.secret_key = os.getenv('PYPI_SECRET_KEY', self.secret_key)
         
-        # Ensure data directory exists
-        Path(self.data_dir).mkdir(parents=True, exist_ok=True)
+        # Let the front-end proxy send package files: 'x-accel' (nginx
+        # X-Accel-Redirect), 'x-sendfile' (apache/lighttpd) or '' to serve
+        # them from Python
+        self.sendfile = os.getenv('PYPI_SENDFILE', '').lower()
+        self.accel_prefix = os.getenv('PYPI_ACCEL_PREFIX', '/_packages/')
+        
+        # max-age of the simple index and listing APIs; they are always
+        # revalidated with their ETag once it has passed
+        self.cache_max_age = int(os.getenv('PYPI_CACHE_MAX_AGE', '0'))
+        
+        # Ensure data directory exists (one stat when it already does)
+        if not os.path.isdir(self.data_dir):
+            Path(self.data_dir).mkdir(parents=True, exist_ok=True)
     
     def save_config(self):
         """Save current configuration to file"""
@@ -0,0 +1,35 @@
+"""
+Gunicorn configuration for PyPI Clone
+
+Usage:
+    gunicorn -c gunicorn_conf.py app:app
+    gunicorn -c gunicorn_conf.py server:app
+
+server.py execs into gunicorn with this file when debug mode is off.
+"""
+
+import os
+
+# PYPI_BIND takes any gunicorn address, e.g. unix:/run/pypi.sock behind nginx
+bind = os.getenv('PYPI_BIND') or f"{os.getenv('PYPI_HOST', 'localhost')}:{os.getenv('PYPI_PORT', '8080')}"
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # One process per core, each multiplexing many slow transfers as
+    # greenlets; gunicorn monkey-patches before the app is imported
+    workers = int(os.getenv('GUNICORN_WORKERS', os.cpu_count() or 1))
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+else:
+    # One process per core (plus one) with a few threads each, so slow uploads
+    # and downloads do not block the simple index
+    workers = int(os.getenv('GUNICORN_WORKERS', (os.cpu_count() or 1) * 2 + 1))
+    threads = int(os.getenv('GUNICORN_THREADS', 4))
+keepalive = 5
+
+# Let the kernel copy file responses straight to the socket
+sendfile = True
+
+# Heartbeat files on tmpfs avoid worker stalls on slow disks
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
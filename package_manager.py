@@ -6,80 +6,512 @@ Package management utilities for PyPI Clone
 import os
 import re
 import json
-import hashlib
-import zipfile
-import tarfile
-import requests
+import time
+import sqlite3
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from packaging.utils import parse_wheel_filename, parse_sdist_filename
-from packaging.version import parse as parse_version, InvalidVersion
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# packaging, requests, zipfile, tarfile, hashlib and email.parser are only
+# imported where they are used, so commands that never read a package
+# file or talk to PyPI skip them
 
 PYPI_JSON_API = "https://pypi.org/pypi"
 
+# Metadata database kept next to the packages; rows are keyed by path and
+# reused while the file's mtime and size are unchanged
+METADATA_DB = 'metadata.db'
+# Bump when the stored package_info changes shape; older rows are discarded
+METADATA_DB_VERSION = 2
+
+# Read size used when hashing package files
+HASH_CHUNK_SIZE = 1 << 20
+
+PACKAGE_SUFFIXES = ('.whl', '.tar.gz')
+
+# Metadata extraction and hashing are I/O bound and release the GIL
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Potentially large metadata fields that usually repeat across versions
+SHARED_TEXT_FIELDS = ('description', 'license')
+
+METADATA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    name TEXT,
+    version TEXT,
+    size INTEGER,
+    mtime REAL,
+    md5 TEXT,
+    sha256 TEXT,
+    summary TEXT,
+    description TEXT,
+    upload_time TEXT,
+    python_tag TEXT,
+    abi_tag TEXT,
+    platform_tag TEXT,
+    info TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT PRIMARY KEY,
+    latest_version TEXT,
+    summary TEXT,
+    author TEXT,
+    home_page TEXT
+);
+"""
+
+# Full-text index over files; the trigram tokenizer keeps the substring
+# semantics of the original search. Triggers keep it in sync with files.
+METADATA_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    name, summary, description, content='files', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts (rowid, name, summary, description)
+    VALUES (new.id, new.name, new.summary, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, name, summary, description)
+    VALUES ('delete', old.id, old.name, old.summary, old.description);
+END;
+"""
+
+# Seconds between full walks of data_dir; in between, only data_dir itself
+# is stat()ed, which catches every upload made through the server. Files
+# copied into subdirectories by hand show up after at most this long.
+TREE_RESCAN_INTERVAL = 2.0
+
+def json_loads(data):
+    """Decode JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj):
+    """Encode JSON to str, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    return json.dumps(obj, default=str)
+
+@lru_cache(maxsize=4096)
+def version_key(version_string):
+    """Create a sortable key from version string
+    
+    Cached, since the same versions are sorted on every listing and
+    parsing a Version is far more expensive than comparing two.
+    """
+    from packaging.version import parse as parse_version, InvalidVersion
+    
+    try:
+        return parse_version(version_string)
+    except InvalidVersion:
+        # Fallback for invalid versions
+        return parse_version("0.0.0")
+
+def split_package_filename(filename):
+    """Return (name, version) from a wheel or sdist filename without opening it"""
+    if filename.endswith('.whl'):
+        parts = filename[:-len('.whl')].split('-')
+    else:
+        parts = filename[:-len('.tar.gz')].rsplit('-', 1)
+    if len(parts) < 2:
+        return parts[0], ''
+    return parts[0], parts[1]
+
+def normalize_name(name):
+    """PEP 503 normalized project name: runs of -, _ and . become one -"""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+# Live managers, so their database connections can be reopened after fork()
+_MANAGERS = weakref.WeakSet()
+
+def _reopen_after_fork():
+    """SQLite connections must not be shared with a forked child
+    (e.g. gunicorn --preload), so every child opens its own"""
+    for manager in list(_MANAGERS):
+        manager._db_lock = threading.Lock()
+        manager.db = manager._open_db()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
 class PackageManager:
     """Manages packages in the PyPI server"""
     
     def __init__(self, data_dir):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
-        self.metadata_cache = {}
+        self.db_path = self.data_dir / METADATA_DB
+        self._db_lock = threading.Lock()
+        self.db = self._open_db()
+        _MANAGERS.add(self)
+        # relative path -> ((mtime, size), package_info), loaded from the
+        # database on first use and kept in step with it afterwards
+        self.metadata_cache = None
+        # (package name, field) -> last text seen, see _share_text()
+        self._shared_text = {}
+        # Grouped get_all_packages() result, and the directory state it was synced at
+        self._all_packages_cache = None
+        # Filename -> relative path of every package file, see resolve_file()
+        self._path_index = None
+        self._synced_tree = None
+        self._synced_hashes = False
+        self._tree_checked = 0.0
+    
+    def _open_db(self):
+        """Open the metadata database, creating its tables if needed"""
+        db = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        # Let INSERT OR REPLACE fire the delete trigger for the search index
+        db.execute('PRAGMA recursive_triggers=ON')
+        db.executescript(METADATA_SCHEMA)
+        if db.execute('PRAGMA user_version').fetchone()[0] != METADATA_DB_VERSION:
+            with db:
+                db.execute('DELETE FROM files')
+                db.execute('DELETE FROM packages')
+            db.execute(f'PRAGMA user_version = {METADATA_DB_VERSION}')
+        try:
+            db.executescript(METADATA_FTS_SCHEMA)
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5 / trigram support; search uses LIKE
+            self.fts_enabled = False
+        return db
+    
+    def get_all_packages(self, include_hashes=True):
+        """Get information about all packages
+        
+        With include_hashes=False, files that were never hashed are listed
+        without md5_digest/sha256_digest instead of being read in full.
+        """
+        self._refresh(include_hashes)
+        packages = self._all_packages_cache
+        if packages is None:
+            with self._db_lock:
+                infos = [package_info for _, package_info in self.metadata_cache.values()
+                         if package_info.get('name')]
+            infos.sort(key=lambda x: x['name'].lower())
+            packages = self._all_packages_cache = self._group_packages(infos)
+        return packages
+    
+    def resolve_file(self, filename):
+        """Return the path of the package file named filename, or None
+        
+        Files may live in subdirectories of data_dir; they are looked up in
+        an index built from the metadata cache instead of searching the tree.
+        """
+        self._refresh(include_hashes=False)
+        index = self._path_index
+        if index is None:
+            index = {}
+            with self._db_lock:
+                paths = list(self.metadata_cache)
+            # Shallowest path wins if the same filename appears twice
+            for rel_path in sorted(paths, key=lambda path: path.count(os.sep), reverse=True):
+                index[os.path.basename(rel_path)] = rel_path
+            self._path_index = index
+        rel_path = index.get(filename)
+        return self.data_dir / rel_path if rel_path else None
     
-    def get_all_packages(self):
-        """Get information about all packages"""
+    def _tree_key(self):
+        """mtimes of data_dir and its subdirectories
+        
+        Adding, removing or renaming a package file changes the mtime of the
+        directory holding it, so an unchanged key means sync() has nothing
+        to pick up.
+        """
+        return tuple(os.stat(dirpath).st_mtime_ns for dirpath, _, _ in os.walk(self.data_dir))
+    
+    def _refresh(self, include_hashes):
+        """sync() unless the data directory is unchanged since the last sync"""
+        if self._synced_tree is not None and (self._synced_hashes or not include_hashes):
+            # Cheap check first: one stat() of data_dir, the first entry of
+            # the tree key, until the next full walk is due
+            now = time.monotonic()
+            if (now - self._tree_checked < TREE_RESCAN_INTERVAL
+                    and os.stat(self.data_dir).st_mtime_ns == self._synced_tree[0]):
+                return
+            tree_key = self._tree_key()
+            self._tree_checked = now
+            if tree_key == self._synced_tree:
+                return
+        else:
+            tree_key = self._tree_key()
+            self._tree_checked = time.monotonic()
+        self.sync(include_hashes)
+        self._synced_tree = tree_key
+        self._synced_hashes = include_hashes
+    
+    def _group_packages(self, infos):
+        """Group package infos by package name, newest version first"""
         packages = {}
+        for package_info in infos:
+            name = package_info['name'].lower()
+            if name not in packages:
+                packages[name] = []
+            packages[name].append(package_info)
+        
+        # Sort versions for each package (PEP 440 order, which SQL cannot do)
+        for name in packages:
+            packages[name].sort(key=lambda x: version_key(x.get('version', '0.0.0')), reverse=True)
+        
+        return packages
+    
+    def _row_to_info(self, info, mtime):
+        """Rebuild a package_info dict from its stored JSON"""
+        package_info = json_loads(info)
+        package_info['upload_time'] = datetime.fromtimestamp(mtime)
+        self._share_text(package_info)
+        return package_info
+    
+    def _share_text(self, package_info):
+        """Make versions of a package share identical long-text objects
         
-        for file_path in self.data_dir.rglob('*'):
-            if not file_path.is_file():
+        Descriptions are often unchanged between releases but would be
+        decoded into a separate string per file; reusing the previous
+        object keeps one copy per package in memory.
+        """
+        name = (package_info.get('name') or '').lower()
+        for field in SHARED_TEXT_FIELDS:
+            value = package_info.get(field)
+            if not value:
                 continue
-                
-            if not (file_path.suffix == '.whl' or file_path.name.endswith('.tar.gz')):
+            key = (name, field)
+            shared = self._shared_text.get(key)
+            if shared == value:
+                package_info[field] = shared
+            else:
+                self._shared_text[key] = value
+    
+    def _package_files(self):
+        """Yield (relative path, DirEntry) for every package file under data_dir
+        
+        Uses os.scandir so the suffix check runs on the bare name and file
+        types come from the directory listing; only package files get a
+        stat() (through entry.stat() by the caller).
+        """
+        stack = [('', str(self.data_dir))]
+        while stack:
+            prefix, directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError:
                 continue
-            
+            with entries:
+                for entry in entries:
+                    name = entry.name
+                    if name.endswith(PACKAGE_SUFFIXES) and entry.is_file():
+                        yield os.path.join(prefix, name), entry
+                    elif entry.is_dir(follow_symlinks=False):
+                        stack.append((os.path.join(prefix, name), entry.path))
+    
+    def sync(self, include_hashes=True):
+        """Bring the metadata database in line with the files on disk
+        
+        Only files whose (mtime, size) changed since they were recorded are
+        opened (and hashed, if include_hashes); everything else is just a
+        stat().
+        """
+        with self._db_lock:
+            if self.metadata_cache is None:
+                self.metadata_cache = {
+                    path: ((mtime, size), self._row_to_info(info, mtime))
+                    for path, mtime, size, info in self.db.execute('SELECT path, mtime, size, info FROM files')
+                }
+            known = {path: entry[0] for path, entry in self.metadata_cache.items()}
+        
+        seen = set()
+        pending = []
+        recorded = False
+        for rel_path, entry in self._package_files():
             try:
-                package_info = self.get_package_info(file_path)
+                stat = entry.stat()
+            except OSError:
+                continue
+            seen.add(rel_path)
+            if known.get(rel_path) == (stat.st_mtime, stat.st_size):
+                package_info = self.metadata_cache[rel_path][1]
+            else:
+                # Another process may already have recorded it
+                package_info = self._lookup_db(rel_path, stat)
                 if package_info:
-                    name = package_info['name'].lower()
-                    if name not in packages:
-                        packages[name] = []
-                    packages[name].append(package_info)
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
-        
-        # Sort versions for each package
-        for name in packages:
-            packages[name].sort(key=lambda x: self._version_key(x.get('version', '0.0.0')), reverse=True)
+                    recorded = True
+                    with self._db_lock:
+                        self.metadata_cache[rel_path] = ((stat.st_mtime, stat.st_size), package_info)
+            
+            if package_info is None or include_hashes and 'sha256_digest' not in package_info:
+                pending.append((entry.path, stat, package_info, include_hashes))
         
-        return packages
+        # Extract and hash new or modified files concurrently
+        if len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(pending))) as executor:
+                results = list(executor.map(self._process_file, pending))
+        else:
+            results = [self._process_file(item) for item in pending]
+        changed = [package_info for package_info in results if package_info]
+        
+        removed = [path for path in known if path not in seen]
+        if changed or removed:
+            self._write_files(changed, removed)
+        elif recorded:
+            with self._db_lock:
+                self._all_packages_cache = None
+                self._path_index = None
+    
+    def _process_file(self, item):
+        """Build or complete the package_info for one pending sync() entry"""
+        path, stat, package_info, include_hashes = item
+        try:
+            if package_info is None:
+                return self._build_package_info(Path(path), stat, include_hashes)
+            return self._add_hashes(path, package_info)
+        except Exception as e:
+            print(f"Error processing {path}: {e}")
+            return None
+    
+    def _lookup_db(self, rel_path, stat):
+        """Return the recorded package_info for rel_path if it is still current"""
+        with self._db_lock:
+            row = self.db.execute(
+                'SELECT info, mtime FROM files WHERE path = ? AND mtime = ? AND size = ?',
+                (rel_path, stat.st_mtime, stat.st_size)
+            ).fetchone()
+        return self._row_to_info(*row) if row else None
+    
+    def _write_files(self, infos, removed_paths=()):
+        """Record new/changed package infos and drop removed paths in one transaction"""
+        with self._db_lock, self.db:
+            names = set()
+            for path in removed_paths:
+                row = self.db.execute('SELECT name FROM files WHERE path = ?', (path,)).fetchone()
+                if row:
+                    names.add(row[0])
+                self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+                if self.metadata_cache is not None:
+                    self.metadata_cache.pop(path, None)
+            
+            for package_info in infos:
+                name = package_info.get('name')
+                name = name.lower() if name else None
+                names.add(name)
+                stored = {key: value for key, value in package_info.items() if key != 'upload_time'}
+                self.db.execute(
+                    'INSERT OR REPLACE INTO files (path, name, version, size, mtime, md5, sha256, summary, '
+                    'description, upload_time, python_tag, abi_tag, platform_tag, info) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (package_info['path'], name, package_info.get('version'), package_info['size'],
+                     package_info['mtime'], package_info.get('md5_digest'), package_info.get('sha256_digest'),
+                     package_info.get('summary', ''), package_info.get('description', ''),
+                     package_info['upload_time'].isoformat(), package_info.get('python_tag'),
+                     package_info.get('abi_tag'), package_info.get('platform_tag'),
+                     json_dumps(stored))
+                )
+                if self.metadata_cache is not None:
+                    self.metadata_cache[package_info['path']] = ((package_info['mtime'], package_info['size']), package_info)
+            
+            names.discard(None)
+            self._refresh_packages(names)
+            self._all_packages_cache = None
+            self._path_index = None
     
-    def get_package_info(self, file_path):
+    def _refresh_packages(self, names):
+        """Recompute the per-package summary rows for the given names"""
+        for name in names:
+            rows = self.db.execute(
+                'SELECT version, summary, info FROM files WHERE name = ?', (name,)
+            ).fetchall()
+            if not rows:
+                self.db.execute('DELETE FROM packages WHERE name = ?', (name,))
+                continue
+            
+            version, summary, info = max(rows, key=lambda row: version_key(row[0] or '0.0.0'))
+            info = json_loads(info)
+            self.db.execute(
+                'INSERT OR REPLACE INTO packages (name, latest_version, summary, author, home_page) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (name, version, summary, info.get('author', ''), info.get('home_page', ''))
+            )
+    
+    def get_package_info(self, file_path, include_hashes=True):
         """Get information about a single package file"""
         file_path = Path(file_path)
         
-        if not file_path.exists():
+        try:
+            stat = file_path.stat()
+        except OSError:
             return None
         
-        # Check cache first
-        cache_key = f"{file_path}:{file_path.stat().st_mtime}"
-        if cache_key in self.metadata_cache:
-            return self.metadata_cache[cache_key]
+        # Check the in-process cache, then the database
+        rel_path = str(file_path.relative_to(self.data_dir))
+        cached = self.metadata_cache.get(rel_path) if self.metadata_cache is not None else None
+        if cached and cached[0] == (stat.st_mtime, stat.st_size):
+            package_info = cached[1]
+        else:
+            package_info = self._lookup_db(rel_path, stat)
+            if package_info and self.metadata_cache is not None:
+                with self._db_lock:
+                    self.metadata_cache[rel_path] = ((stat.st_mtime, stat.st_size), package_info)
+        
+        if package_info is None:
+            package_info = self._build_package_info(file_path, stat, include_hashes)
+        elif include_hashes and 'sha256_digest' not in package_info:
+            package_info = self._add_hashes(file_path, package_info)
+        else:
+            return package_info
+        
+        self._write_files([package_info])
+        return package_info
+    
+    def get_hashes(self, file_path):
+        """Get {'md5', 'sha256'} for a package file, hashing it at most once per (mtime, size)"""
+        package_info = self.get_package_info(file_path, include_hashes=True)
+        if not package_info:
+            return None
+        return {'md5': package_info['md5_digest'], 'sha256': package_info['sha256_digest']}
+    
+    def _add_hashes(self, file_path, package_info):
+        """Return a copy of package_info with the file's digests filled in"""
+        hashes = self._calculate_hashes(file_path)
+        return dict(package_info, md5_digest=hashes['md5'], sha256_digest=hashes['sha256'])
+    
+    def _build_package_info(self, file_path, stat, include_hashes=True, write_sidecar=False):
+        """Extract a package file's metadata, and hash it if include_hashes
         
+        With write_sidecar, a wheel's .metadata file is written as well;
+        only done when the file is stored, never while listing.
+        """
         filename = file_path.name
-        stat = file_path.stat()
         
         package_info = {
             'filename': filename,
             'path': str(file_path.relative_to(self.data_dir)),
             'size': stat.st_size,
-            'upload_time': datetime.fromtimestamp(stat.st_mtime),
-            'md5_digest': self._calculate_hash(file_path, 'md5'),
-            'sha256_digest': self._calculate_hash(file_path, 'sha256')
+            'mtime': stat.st_mtime,
+            'upload_time': datetime.fromtimestamp(stat.st_mtime)
         }
+        if include_hashes:
+            hashes = self._calculate_hashes(file_path)
+            package_info['md5_digest'] = hashes['md5']
+            package_info['sha256_digest'] = hashes['sha256']
+        
+        from packaging.utils import parse_wheel_filename, parse_sdist_filename
         
         # Extract metadata
         try:
             if filename.endswith('.whl'):
-                metadata = self._extract_wheel_metadata(file_path)
+                metadata = self._extract_wheel_metadata(file_path, write_sidecar)
                 # Parse wheel filename for name and version
                 try:
                     name, version, build_tag, python_tag, abi_tag, platform_tag = parse_wheel_filename(filename)
@@ -118,111 +550,173 @@ class PackageManager:
         except Exception as e:
             print(f"Error extracting metadata from {filename}: {e}")
         
-        # Cache the result
-        self.metadata_cache[cache_key] = package_info
+        self._share_text(package_info)
         return package_info
     
-    def _extract_wheel_metadata(self, file_path):
+    def _read_wheel_metadata(self, file_path):
+        """Return the raw bytes of a wheel's METADATA, or None"""
+        import zipfile
+        
+        with zipfile.ZipFile(file_path, 'r') as zf:
+            # The wheel filename gives the .dist-info directory directly;
+            # only scan the member list if it was named differently
+            dist_info = '-'.join(Path(file_path).name.split('-')[:2])
+            metadata_file = f"{dist_info}.dist-info/METADATA"
+            try:
+                zf.getinfo(metadata_file)
+            except KeyError:
+                metadata_file = next(
+                    (name for name in zf.namelist() if name.endswith('.dist-info/METADATA')), None
+                )
+            if not metadata_file:
+                return None
+            with zf.open(metadata_file) as f:
+                return f.read()
+    
+    def _extract_wheel_metadata(self, file_path, write_sidecar=False):
         """Extract metadata from wheel file"""
+        import hashlib
+        
         metadata = {}
         try:
-            with zipfile.ZipFile(file_path, 'r') as zf:
-                # Find METADATA file
-                metadata_file = None
-                for name in zf.namelist():
-                    if name.endswith('.dist-info/METADATA'):
-                        metadata_file = name
-                        break
-                
-                if metadata_file:
-                    with zf.open(metadata_file) as f:
-                        content = f.read().decode('utf-8')
-                        metadata = self._parse_metadata(content)
+            raw = self._read_wheel_metadata(file_path)
+            if raw is not None:
+                metadata = self._parse_metadata(raw.decode('utf-8'))
+                # The hash is of the bytes the .metadata route serves, so it
+                # holds whether or not the sidecar has been written yet
+                metadata['metadata_sha256'] = hashlib.sha256(raw).hexdigest()
+                if write_sidecar:
+                    self._write_metadata_file(file_path, raw)
         except Exception as e:
             print(f"Error reading wheel metadata: {e}")
         
         return metadata
     
+    def _write_metadata_file(self, file_path, raw):
+        """Write a wheel's METADATA next to it as <wheel>.metadata (PEP 658)
+        
+        Returns True if it was written.
+        """
+        metadata_path = Path(f"{file_path}.metadata")
+        tmp_path = f"{metadata_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp_path, metadata_path)
+        except OSError as e:
+            print(f"Error writing {metadata_path.name}: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return False
+        return True
+    
+    def resolve_metadata_file(self, filename):
+        """Return the .metadata file for the wheel named filename, or None
+        
+        The file is written when the wheel is stored; wheels that were
+        copied into data_dir get theirs on the first request for it.
+        """
+        if not filename.endswith('.whl'):
+            return None
+        file_path = self.resolve_file(filename)
+        if file_path is None:
+            return None
+        metadata_path = Path(f"{file_path}.metadata")
+        if metadata_path.exists():
+            return metadata_path
+        
+        try:
+            raw = self._read_wheel_metadata(file_path)
+        except Exception as e:
+            print(f"Error reading wheel metadata: {e}")
+            return None
+        if raw is None:
+            return None
+        # Writing changes the directory's mtime; if the tree was in sync
+        # before, record the new key so this is not mistaken for a change
+        # that needs a full sync
+        in_sync = self._synced_tree is not None and self._tree_key() == self._synced_tree
+        if not self._write_metadata_file(file_path, raw):
+            return None
+        if in_sync:
+            self._synced_tree = self._tree_key()
+        return metadata_path
+    
     def _extract_sdist_metadata(self, file_path):
         """Extract metadata from source distribution"""
+        import tarfile
+        
         metadata = {}
         try:
-            with tarfile.open(file_path, 'r:gz') as tf:
-                # Look for PKG-INFO file
-                pkg_info_file = None
-                for member in tf.getmembers():
+            # Stream the members and stop at PKG-INFO instead of reading
+            # every header in the archive with getmembers()
+            with tarfile.open(file_path, 'r|gz') as tf:
+                for member in tf:
                     if member.name.endswith('/PKG-INFO') or member.name == 'PKG-INFO':
-                        pkg_info_file = member
+                        f = tf.extractfile(member)
+                        if f:
+                            content = f.read().decode('utf-8')
+                            metadata = self._parse_metadata(content)
                         break
-                
-                if pkg_info_file:
-                    f = tf.extractfile(pkg_info_file)
-                    if f:
-                        content = f.read().decode('utf-8')
-                        metadata = self._parse_metadata(content)
         except Exception as e:
             print(f"Error reading sdist metadata: {e}")
         
         return metadata
     
     def _parse_metadata(self, content):
-        """Parse PKG-INFO/METADATA format"""
-        metadata = {}
-        lines = content.split('\n')
-        i = 0
+        """Parse PKG-INFO/METADATA format
         
-        while i < len(lines):
-            line = lines[i].strip()
-            if not line or not ':' in line:
-                i += 1
-                continue
-            
-            key, value = line.split(':', 1)
-            key = key.strip()
-            value = value.strip()
-            
-            # Handle multiline values
-            if key in ['Description', 'Description-Content-Type']:
-                description_lines = [value] if value else []
-                i += 1
-                while i < len(lines) and (lines[i].startswith('        ') or lines[i].strip() == ''):
-                    description_lines.append(lines[i].rstrip())
-                    i += 1
-                metadata[key.lower().replace('-', '_')] = '\n'.join(description_lines).strip()
-                continue
-            
-            metadata[key.lower().replace('-', '_')] = value
-            i += 1
+        The header block is RFC 822 style, so the stdlib email parser reads
+        it (folded continuation lines included) in one call. The long
+        description is the message body (Metadata 2.1+) or a legacy
+        Description header.
+        """
+        from email.parser import Parser
+        
+        msg = Parser().parsestr(content.lstrip())
+        metadata = {key.lower().replace('-', '_'): value.strip() for key, value in msg.items()}
+        
+        description = msg.get_payload()
+        if not description and 'description' in metadata:
+            description = '\n'.join(line.strip() for line in metadata['description'].splitlines())
+        if description:
+            metadata['description'] = description.strip()
         
         return metadata
     
-    def _calculate_hash(self, file_path, algorithm='md5'):
-        """Calculate hash of file"""
-        if algorithm == 'md5':
-            hasher = hashlib.md5()
-        elif algorithm == 'sha256':
-            hasher = hashlib.sha256()
-        else:
-            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+    def _calculate_hashes(self, file_path):
+        """Calculate MD5 and SHA-256 of a file in a single read pass"""
+        import hashlib
+        
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
         
         try:
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(8192), b""):
-                    hasher.update(chunk)
-            return hasher.hexdigest()
+            # Unbuffered reads straight into one reused 1 MiB buffer
+            with open(file_path, 'rb', buffering=0) as f:
+                buffer = bytearray(HASH_CHUNK_SIZE)
+                view = memoryview(buffer)
+                while True:
+                    size = f.readinto(buffer)
+                    if not size:
+                        break
+                    md5.update(view[:size])
+                    sha256.update(view[:size])
+            return {'md5': md5.hexdigest(), 'sha256': sha256.hexdigest()}
         except Exception:
-            return ""
+            return {'md5': '', 'sha256': ''}
     
     def _version_key(self, version_string):
         """Create a sortable key from version string"""
-        try:
-            return parse_version(version_string)
-        except InvalidVersion:
-            # Fallback for invalid versions
-            return parse_version("0.0.0")
+        return version_key(version_string)
     
     def store_package(self, file_data, filename, overwrite=False):
-        """Store a package file"""
+        """Store a package file
+        
+        file_data is either bytes or a readable file object; file objects
+        are copied in HASH_CHUNK_SIZE chunks instead of being read into
+        memory whole. The file is hashed as it is written.
+        """
         filepath = self.data_dir / filename
         
         if filepath.exists() and not overwrite:
@@ -231,12 +725,99 @@ class PackageManager:
         # Create directory if needed
         filepath.parent.mkdir(parents=True, exist_ok=True)
         
-        # Write file
+        if hasattr(file_data, 'read'):
+            chunks = iter(lambda: file_data.read(HASH_CHUNK_SIZE), b'')
+        else:
+            chunks = (file_data,)
         with open(filepath, 'wb') as f:
-            f.write(file_data)
+            digests = self._write_chunks(f, chunks)
         
+        # Record it right away so the next listing needs no rescan
+        self._record_stored(filepath, digests)
         return filepath
     
+    def _write_chunks(self, f, chunks):
+        """Write chunks to f, returning their {'md5', 'sha256'} from the same pass"""
+        import hashlib
+        
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        for chunk in chunks:
+            f.write(chunk)
+            md5.update(chunk)
+            sha256.update(chunk)
+        return {'md5': md5.hexdigest(), 'sha256': sha256.hexdigest()}
+    
+    def _spool(self, chunks):
+        """Write chunks to a hidden temp file in data_dir
+        
+        Returns (temp path, digests); the caller moves the file into place
+        with store_package_from_path() or removes it.
+        """
+        import tempfile
+        
+        with tempfile.NamedTemporaryFile(dir=self.data_dir, prefix='.import-', suffix='.tmp', delete=False) as f:
+            try:
+                digests = self._write_chunks(f, chunks)
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        return f.name, digests
+    
+    def _record_stored(self, filepath, digests=None):
+        """Add a newly stored file to the metadata database"""
+        stat = filepath.stat()
+        package_info = self._build_package_info(filepath, stat, include_hashes=digests is None,
+                                                write_sidecar=True)
+        if digests is not None:
+            package_info['md5_digest'] = digests['md5']
+            package_info['sha256_digest'] = digests['sha256']
+        self._write_files([package_info])
+        self._synced_tree = None
+    
+    def store_package_from_path(self, source_path, filename, digests=None, overwrite=False):
+        """Move an already written file (e.g. a spooled upload) into place
+        
+        source_path must be on the same filesystem as data_dir. digests is
+        an optional {'md5', 'sha256'} dict computed while the file was
+        written, so it is not read again to hash it.
+        """
+        filepath = self.data_dir / filename
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        
+        if overwrite:
+            os.replace(source_path, filepath)
+        else:
+            # link() fails if the target exists, so concurrent stores of the
+            # same filename cannot overwrite each other
+            try:
+                os.link(source_path, filepath)
+            except FileExistsError:
+                raise FileExistsError(f"Package {filename} already exists")
+            except OSError:
+                # No hard links here (SMB/CIFS, some FUSE mounts); an
+                # exclusive create keeps the same no-overwrite guarantee
+                self._copy_exclusive(source_path, filepath)
+            os.unlink(source_path)
+        
+        self._record_stored(filepath, digests)
+        return filepath
+    
+    def _copy_exclusive(self, source_path, filepath):
+        """Copy source_path to filepath, failing if filepath already exists"""
+        import shutil
+        
+        try:
+            f = open(filepath, 'xb')
+        except FileExistsError:
+            raise FileExistsError(f"Package {filepath.name} already exists")
+        try:
+            with f, open(source_path, 'rb') as source:
+                shutil.copyfileobj(source, f, HASH_CHUNK_SIZE)
+        except BaseException:
+            os.unlink(filepath)
+            raise
+    
     def delete_package(self, filename):
         """Delete a package file"""
         filepath = self.data_dir / filename
@@ -245,20 +826,39 @@ class PackageManager:
             raise FileNotFoundError(f"Package {filename} not found")
         
         filepath.unlink()
+        metadata_path = Path(f"{filepath}.metadata")
+        if metadata_path.exists():
+            metadata_path.unlink()
         
-        # Clean up cache
-        cache_keys_to_remove = [key for key in self.metadata_cache.keys() if filename in key]
-        for key in cache_keys_to_remove:
-            del self.metadata_cache[key]
+        # Drop it from the metadata database
+        self._write_files([], [str(filepath.relative_to(self.data_dir))])
+        self._synced_tree = None
     
     def search_packages(self, query):
         """Search packages by name or description"""
         query = query.lower()
-        packages = self.get_all_packages()
+        self._refresh(include_hashes=False)
+        
+        # Find the matching files in SQL, then load every version of their packages
+        if self.fts_enabled and len(query) >= 3:
+            match_where = 'id IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?1)'
+            param = '"' + query.replace('"', '""') + '"'
+        else:
+            match_where = ("name LIKE ?1 ESCAPE '\\' "
+                           "OR summary LIKE ?1 ESCAPE '\\' OR description LIKE ?1 ESCAPE '\\'")
+            param = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        with self._db_lock:
+            matched_paths = {path for path, in self.db.execute(f'SELECT path FROM files WHERE {match_where}', (param,))}
+            paths = self.db.execute(
+                f'SELECT path FROM files WHERE name IN (SELECT name FROM files WHERE {match_where}) ORDER BY name',
+                (param,)
+            ).fetchall()
+            infos = [self.metadata_cache[path][1] for path, in paths if path in self.metadata_cache]
+        packages = self._group_packages(infos)
         results = []
         
         for name, versions in packages.items():
-            if query in name.lower():
+            if query in name:
                 # Get latest version
                 latest = versions[0] if versions else {}
                 results.append({
@@ -271,11 +871,9 @@ class PackageManager:
                     'versions': [v.get('version', 'unknown') for v in versions]
                 })
             else:
-                # Search in descriptions
+                # Newest version whose summary/description matched in SQL
                 for version in versions:
-                    summary = version.get('summary', '').lower()
-                    description = version.get('description', '').lower()
-                    if query in summary or query in description:
+                    if version['path'] in matched_paths:
                         results.append({
                             'name': name,
                             'latest_version': version.get('version', 'unknown'),
@@ -291,25 +889,65 @@ class PackageManager:
     
     def get_package_stats(self):
         """Get statistics about packages"""
-        packages = self.get_all_packages()
+        self._refresh(include_hashes=False)
+        with self._db_lock:
+            total_packages, total_files, total_size = self.db.execute(
+                'SELECT COUNT(DISTINCT name), COUNT(*), COALESCE(SUM(size), 0) FROM files WHERE name IS NOT NULL'
+            ).fetchone()
+        
+        return {
+            'total_packages': total_packages,
+            'total_files': total_files,
+            'total_size': total_size,
+            'total_size_mb': round(total_size / (1024 * 1024), 2)
+        }
+
+    def get_package_stats_fast(self, recent=0):
+        """Get package statistics from the directory listing alone
+        
+        Nothing is opened or hashed and the metadata database is not
+        touched: sizes come from stat() and names/versions from the
+        filenames. With recent > 0, also returns the newest files as
+        (name, version, upload_time) tuples under 'recent'.
+        """
+        import heapq
         
-        total_packages = len(packages)
-        total_files = sum(len(versions) for versions in packages.values())
         total_size = 0
+        total_files = 0
+        names = set()
+        files = []
         
-        for versions in packages.values():
-            for version in versions:
-                total_size += version.get('size', 0)
+        for _, entry in self._package_files():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            name, version = split_package_filename(entry.name)
+            # Wheels spell the name with _, sdists often with -
+            name = normalize_name(name)
+            names.add(name)
+            total_files += 1
+            total_size += stat.st_size
+            if recent:
+                files.append((stat.st_mtime, name, version))
         
-        return {
-            'total_packages': total_packages,
+        stats = {
+            'total_packages': len(names),
             'total_files': total_files,
             'total_size': total_size,
             'total_size_mb': round(total_size / (1024 * 1024), 2)
         }
+        if recent:
+            stats['recent'] = [
+                (name, version, datetime.fromtimestamp(mtime))
+                for mtime, name, version in heapq.nlargest(recent, files)
+            ]
+        return stats
 
     def fetch_pypi_info(self, package_name, version=None):
         """Fetch package information from official PyPI without downloading."""
+        import requests
+
         if version:
             url = f"{PYPI_JSON_API}/{package_name}/{version}/json"
         else:
@@ -327,7 +965,7 @@ class PackageManager:
 
         available_versions = sorted(
             releases.keys(),
-            key=lambda v: self._version_key(v),
+            key=version_key,
             reverse=True
         )
 
@@ -343,6 +981,8 @@ class PackageManager:
 
     def import_from_pypi(self, package_name, version=None):
         """Download and store a package from official PyPI."""
+        import requests
+
         if version:
             url = f"{PYPI_JSON_API}/{package_name}/{version}/json"
         else:
@@ -387,18 +1027,22 @@ class PackageManager:
                     errors.append(f"{filename}: HTTP {file_resp.status_code}")
                     continue
 
-                file_data = file_resp.content
-
-                # Verify SHA-256 checksum
-                expected_sha256 = release_file.get('digests', {}).get('sha256', '')
-                if expected_sha256:
-                    actual_sha256 = hashlib.sha256(file_data).hexdigest()
-                    if actual_sha256 != expected_sha256:
+                # Stream it to disk, hashing as it arrives
+                tmp_path, digests = self._spool(file_resp.iter_content(HASH_CHUNK_SIZE))
+                try:
+                    # Verify SHA-256 checksum
+                    expected_sha256 = release_file.get('digests', {}).get('sha256', '')
+                    if expected_sha256 and digests['sha256'] != expected_sha256:
                         errors.append(f"{filename}: checksum mismatch")
                         continue
 
-                self.store_package(file_data, filename)
-                downloaded.append(filename)
+                    self.store_package_from_path(tmp_path, filename, digests)
+                    downloaded.append(filename)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+            except FileExistsError:
+                skipped.append(filename)
             except requests.RequestException as exc:
                 errors.append(f"{filename}: {exc}")
 
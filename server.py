@@ -13,28 +13,150 @@ This is an enhanced version of the PyPI clone with:
 
 import os
 import sys
+import gzip
+import hashlib
+import tempfile
+from functools import lru_cache
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template_string, send_file, abort, redirect, url_for
+from urllib.parse import quote
+from flask import Flask, Response, request, jsonify, send_file, abort, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
+from markupsafe import escape
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
 
 # Import our modules
 from config import Config
-from package_manager import PackageManager
+from package_manager import PackageManager, PACKAGE_SUFFIXES
 from auth import UserManager, SimpleAuth
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify() and request.get_json() through orjson
+    
+    Keys stay sorted and dates keep Flask's HTTP-date format, so responses
+    match the default provider's apart from non-ASCII text being sent as
+    UTF-8 instead of \\u escapes.
+    """
+    
+    def _options(self, pretty=False):
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(pretty)) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 # Load configuration
 config = Config()
 app.config['SECRET_KEY'] = config.secret_key
 app.config['MAX_CONTENT_LENGTH'] = config.max_file_size
+app.config['USE_X_SENDFILE'] = config.sendfile == 'x-sendfile'
 
 # Initialize managers
 package_manager = PackageManager(config.data_dir)
 user_manager = UserManager()
 auth = SimpleAuth(user_manager)
 
+# secure_filename() runs a few regexes; download URLs repeat a lot
+safe_filename = lru_cache(maxsize=16384)(secure_filename)
+
+# Read size used when spooling uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Rendered simple API pages and API listings: key -> {encoding: body} plus
+# ETag. Valid for the get_all_packages() result they were rendered from,
+# which is a new object whenever the package set changes.
+_RESPONSE_CACHE = {'packages': None, 'pages': {}}
+RESPONSE_CACHE_MAX_PAGES = 4096
+# Stands in for the request's host in the cached index page; autoescaping
+# leaves it untouched
+HOST_PLACEHOLDER = '\x00host\x00'
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 512
+
+def _compress(body, encoding):
+    """Compress a response body for a Content-Encoding"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def cached_response(packages, key, render, mimetype='text/html'):
+    """Serve a page that only changes with the package set
+    
+    render() runs once per package-set change; compressed variants are
+    made on first request and kept alongside. Responses carry a strong
+    ETag, so clients revalidating their cache get a 304.
+    """
+    bodies, etag = _cached_page(packages, key, render)
+    return _page_response(bodies, etag, mimetype)
+
+def _cached_page(packages, key, render):
+    """Return ({encoding: body}, ETag) for key, rendering it if needed"""
+    if _RESPONSE_CACHE['packages'] is not packages:
+        _RESPONSE_CACHE['packages'] = packages
+        _RESPONSE_CACHE['pages'] = {}
+    pages = _RESPONSE_CACHE['pages']
+    
+    page = pages.get(key)
+    if page is None:
+        body = render()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        page = ({'identity': body}, hashlib.sha256(body).hexdigest()[:32])
+        if len(pages) >= RESPONSE_CACHE_MAX_PAGES:
+            pages.clear()
+        pages[key] = page
+    return page
+
+def _page_response(bodies, etag, mimetype):
+    """Response for a page, in the best encoding the client accepts;
+    missing compressed variants are added to bodies"""
+    encoding = 'identity'
+    if len(bodies['identity']) >= COMPRESS_MIN_SIZE:
+        accepted = request.accept_encodings
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+    body = bodies.get(encoding)
+    if body is None:
+        body = bodies[encoding] = _compress(bodies['identity'], encoding)
+    
+    response = Response(body, mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+        etag = f"{etag}-{encoding}"
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = config.cache_max_age
+    response.cache_control.must_revalidate = True
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 @app.errorhandler(413)
 def too_large(e):
     return jsonify({'error': 'File too large'}), 413
@@ -47,34 +169,46 @@ def handle_file_too_large(e):
 def index():
     """Main web interface"""
     packages = package_manager.get_all_packages()
-    stats = package_manager.get_package_stats()
-    return render_template_string(ENHANCED_INDEX_TEMPLATE, 
-                                packages=packages, 
-                                stats=stats, 
-                                auth_enabled=config.auth_enabled)
+    
+    def render():
+        stats = package_manager.get_package_stats()
+        return ENHANCED_INDEX_TMPL.render(packages=packages, 
+                                          stats=stats, 
+                                          auth_enabled=config.auth_enabled,
+                                          host=HOST_PLACEHOLDER)
+    
+    # The page only changes with the package set, apart from the host it
+    # shows in the upload instructions. That is filled in per request:
+    # the Host header is client-controlled, so it must not key the cache.
+    bodies, etag = _cached_page(packages, "index", render)
+    host = str(escape(request.host)).encode('utf-8')
+    body = bodies['identity'].replace(HOST_PLACEHOLDER.encode('utf-8'), host)
+    etag = f"{etag}-{hashlib.sha256(host).hexdigest()[:8]}"
+    return _page_response({'identity': body}, etag, 'text/html')
 
 @app.route('/simple/')
 def simple_index():
     """PyPI simple API - package index"""
     packages = package_manager.get_all_packages()
-    package_names = sorted(packages.keys())
     
-    html = """<!DOCTYPE html>
+    def render():
+        parts = ["""<!DOCTYPE html>
 <html>
 <head>
     <title>Simple index</title>
 </head>
 <body>
     <h1>Simple index</h1>
-"""
-    
-    for name in package_names:
-        html += f'    <a href="/simple/{name}/">{name}</a><br>\n'
-    
-    html += """</body>
-</html>"""
+"""]
+        
+        for name in sorted(packages.keys()):
+            parts.append(f'    <a href="/simple/{name}/">{name}</a><br>\n')
+        
+        parts.append("""</body>
+</html>""")
+        return ''.join(parts)
     
-    return html
+    return cached_response(packages, ("simple",), render)
 
 @app.route('/simple/<package_name>/')
 def simple_package(package_name):
@@ -87,46 +221,64 @@ def simple_package(package_name):
     
     package_files = packages[package_name_lower]
     
-    html = f"""<!DOCTYPE html>
+    def render():
+        parts = [f"""<!DOCTYPE html>
 <html>
 <head>
     <title>Links for {package_name}</title>
 </head>
 <body>
     <h1>Links for {package_name}</h1>
-"""
-    
-    for file_info in package_files:
-        filename = file_info['filename']
-        md5_hash = file_info.get('md5_digest', '')
-        sha256_hash = file_info.get('sha256_digest', '')
-        html += f'    <a href="/packages/{filename}#sha256={sha256_hash}" data-dist-info-metadata="sha256={sha256_hash}">{filename}</a><br>\n'
-    
-    html += """</body>
-</html>"""
+"""]
+        
+        for file_info in package_files:
+            filename = file_info['filename']
+            sha256_hash = file_info.get('sha256_digest', '')
+            # PEP 658/714: advertise the wheel's .metadata file by its own hash
+            metadata_hash = file_info.get('metadata_sha256')
+            if metadata_hash:
+                metadata_attrs = f' data-dist-info-metadata="sha256={metadata_hash}" data-core-metadata="sha256={metadata_hash}"'
+            else:
+                metadata_attrs = ''
+            parts.append(f'    <a href="/packages/{filename}#sha256={sha256_hash}"{metadata_attrs}>{filename}</a><br>\n')
+        
+        parts.append("""</body>
+</html>""")
+        return ''.join(parts)
     
-    return html
+    # Keyed by the name as requested, since the page title echoes it
+    return cached_response(packages, ("simple", package_name), render)
 
 @app.route('/packages/<filename>')
 def download_package(filename):
     """Download package file"""
-    filename = secure_filename(filename)
-    file_path = Path(config.data_dir) / filename
-    
-    # Also check in subdirectories
-    if not file_path.exists():
-        found = False
-        for file_path in Path(config.data_dir).rglob(filename):
-            if file_path.is_file():
-                found = True
-                break
-        if not found:
-            abort(404)
-    
-    return send_file(str(file_path), as_attachment=True)
-
-@app.route('/upload', methods=['POST'])
-@auth.require_auth() if config.auth_enabled else lambda f: f
+    # Indexed lookup, so a miss does not search the whole tree
+    file_path = package_manager.resolve_file(safe_filename(filename))
+    if file_path is None:
+        abort(404)
+    
+    if config.sendfile == 'x-accel':
+        # nginx streams the file from its internal location; only the
+        # headers go through Python
+        relative_path = file_path.relative_to(config.data_dir).as_posix()
+        return Response(headers={
+            'X-Accel-Redirect': config.accel_prefix + quote(relative_path),
+            'Content-Type': 'application/octet-stream',
+            'Content-Disposition': f'attachment; filename="{file_path.name}"',
+        })
+    
+    # Conditional and range requests get 304/206 responses; with
+    # PYPI_SENDFILE=x-sendfile the front-end server sends the body
+    return send_file(str(file_path), as_attachment=True, conditional=True, etag=True)
+
+@app.route('/packages/<filename>.metadata')
+def download_package_metadata(filename):
+    """Core metadata of a wheel (PEP 658), so resolvers can skip the download"""
+    metadata_path = package_manager.resolve_metadata_file(safe_filename(filename))
+    if metadata_path is None:
+        abort(404)
+    return send_file(str(metadata_path), mimetype='text/plain', conditional=True, etag=True)
+
 def upload_package():
     """Upload package file"""
     # Check if file was uploaded
@@ -138,24 +290,39 @@ def upload_package():
         return jsonify({'error': 'No file selected'}), 400
     
     # Validate file type
-    if not (file.filename.endswith('.whl') or file.filename.endswith('.tar.gz')):
+    if not file.filename.endswith(PACKAGE_SUFFIXES):
         return jsonify({'error': 'Only .whl and .tar.gz files are supported'}), 400
     
-    # Read file data
-    file_data = file.read()
-    if len(file_data) == 0:
-        return jsonify({'error': 'Empty file'}), 400
-    
-    filename = secure_filename(file.filename)
+    filename = safe_filename(file.filename)
     
+    # Spool the upload to a hidden temp file next to the packages, hashing
+    # it in the same pass, then link it into place
+    tmp = tempfile.NamedTemporaryFile(dir=config.data_dir, prefix='.upload-', suffix='.tmp', delete=False)
     try:
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        file_size = 0
+        with tmp:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                tmp.write(chunk)
+                md5.update(chunk)
+                sha256.update(chunk)
+                file_size += len(chunk)
+        
+        if file_size == 0:
+            return jsonify({'error': 'Empty file'}), 400
+        
         # Check if file already exists
         file_path = Path(config.data_dir) / filename
         if file_path.exists():
             return jsonify({'error': 'File already exists'}), 409
         
         # Store the package
-        stored_path = package_manager.store_package(file_data, filename)
+        digests = {'md5': md5.hexdigest(), 'sha256': sha256.hexdigest()}
+        stored_path = package_manager.store_package_from_path(tmp.name, filename, digests)
         
         # Get package info for response
         package_info = package_manager.get_package_info(stored_path)
@@ -163,12 +330,22 @@ def upload_package():
         return jsonify({
             'message': 'Package uploaded successfully', 
             'filename': filename,
-            'size': len(file_data),
+            'size': file_size,
             'package_info': package_info
         }), 200
         
+    except FileExistsError:
+        return jsonify({'error': 'File already exists'}), 409
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    finally:
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+
+# Only wrapped in the auth check when authentication is enabled
+if config.auth_enabled:
+    upload_package = auth.require_auth()(upload_package)
+app.add_url_rule('/upload', 'upload_package', upload_package, methods=['POST'])
 
 @app.route('/search')
 def search_packages():
@@ -185,7 +362,8 @@ def search_packages():
 def api_packages():
     """API endpoint to get all packages"""
     packages = package_manager.get_all_packages()
-    return jsonify(packages)
+    return cached_response(packages, ("api", "packages"), lambda: jsonify(packages).get_data(),
+                           mimetype='application/json')
 
 @app.route('/api/packages/<package_name>')
 def api_package_info(package_name):
@@ -204,8 +382,11 @@ def api_package_info(package_name):
 @app.route('/api/stats')
 def api_stats():
     """API endpoint to get server statistics"""
-    stats = package_manager.get_package_stats()
-    return jsonify(stats)
+    # Stats only change with the package set, like the listing
+    packages = package_manager.get_all_packages(include_hashes=False)
+    return cached_response(packages, ("api", "stats"),
+                           lambda: jsonify(package_manager.get_package_stats()).get_data(),
+                           mimetype='application/json')
 
 @app.route('/api/pypi-info/<package_name>')
 def api_pypi_info(package_name):
@@ -245,7 +426,7 @@ if config.auth_enabled:
         """Admin panel"""
         users = user_manager.list_users()
         stats = package_manager.get_package_stats()
-        return render_template_string(ADMIN_TEMPLATE, users=users, stats=stats)
+        return ADMIN_TMPL.render(users=users, stats=stats)
     
     @app.route('/admin/users', methods=['GET', 'POST'])
     @auth.require_auth(admin_required=True)
@@ -463,7 +644,7 @@ ENHANCED_INDEX_TEMPLATE = """
         <div class="upload-section">
             <h3>📦 Upload Packages</h3>
             <p>Use <strong>twine</strong> to upload your Python packages:</p>
-            <code>twine upload --repository-url http://{{ request.host }}/upload dist/*</code>
+            <code>twine upload --repository-url http://{{ host }}/upload dist/*</code>
             {% if auth_enabled %}
             <p><strong>🔐 Authentication required:</strong> username: <code>admin</code>, password: <code>admin</code></p>
             {% endif %}
@@ -950,6 +1131,10 @@ ADMIN_TEMPLATE = """
 </html>
 """
 
+# Compiled once here; render_template_string() would re-parse them per request
+ENHANCED_INDEX_TMPL = app.jinja_env.from_string(ENHANCED_INDEX_TEMPLATE)
+ADMIN_TMPL = app.jinja_env.from_string(ADMIN_TEMPLATE)
+
 def main():
     """Main entry point"""
     print(f"🚀 Starting PyPI Clone server...")
@@ -960,6 +1145,28 @@ def main():
     if config.auth_enabled:
         print(f"👤 Default admin credentials: admin / admin")
     
+    # Outside debug mode, hand the process over to gunicorn (all cores,
+    # keep-alive, threaded workers); PYPI_BIND can name a unix socket
+    if not config.debug:
+        from importlib.util import find_spec
+        if find_spec('gunicorn') is None:
+            print("⚠️  gunicorn is not installed; falling back to the development server")
+        else:
+            bind = os.getenv('PYPI_BIND') or f"{config.host}:{config.port}"
+            base_dir = os.path.dirname(os.path.abspath(__file__))
+            args = [
+                sys.executable, '-m', 'gunicorn',
+                '-c', os.path.join(base_dir, 'gunicorn_conf.py'),
+                '--bind', bind,
+                '--pythonpath', base_dir,
+            ]
+            # Users and tokens live in each process' memory, so with auth
+            # on every request has to reach the same process; it still
+            # serves requests concurrently on its threads
+            if config.auth_enabled:
+                args += ['--workers', '1']
+            os.execv(sys.executable, args + ['server:app'])
+    
     try:
         app.run(host=config.host, port=config.port, debug=config.debug)
     except KeyboardInterrupt:
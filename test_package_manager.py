@@ -0,0 +1,34 @@
+"""
+Unit tests for PackageManager; they need no running server
+"""
+
+import pytest
+
+from package_manager import PackageManager
+
+def test_stats_fast_normalizes_names(tmp_path):
+    for filename in ('demo-pkg-1.0.0.tar.gz', 'demo_pkg-1.2.0-py3-none-any.whl',
+                     'Demo.Pkg-1.3.0.tar.gz', 'other-2.0.tar.gz'):
+        (tmp_path / filename).write_bytes(b'')
+    stats = PackageManager(tmp_path).get_package_stats_fast(recent=4)
+    assert stats['total_packages'] == 2
+    assert stats['total_files'] == 4
+    assert {name for name, _, _ in stats['recent']} == {'demo-pkg', 'other'}
+
+def test_store_without_hard_links(tmp_path, monkeypatch):
+    def no_link(src, dst):
+        raise PermissionError(1, 'Operation not permitted')
+    monkeypatch.setattr('os.link', no_link)
+    manager = PackageManager(tmp_path)
+    
+    source = tmp_path / '.upload-1.tmp'
+    source.write_bytes(b'first')
+    manager.store_package_from_path(source, 'demo-1.0.tar.gz')
+    assert (tmp_path / 'demo-1.0.tar.gz').read_bytes() == b'first'
+    assert not source.exists()
+    
+    # The exclusive create still refuses to overwrite
+    source.write_bytes(b'second')
+    with pytest.raises(FileExistsError):
+        manager.store_package_from_path(source, 'demo-1.0.tar.gz')
+    assert (tmp_path / 'demo-1.0.tar.gz').read_bytes() == b'first'
@@ -3,25 +3,130 @@
 Test script to verify PyPI Clone functionality
 """
 
+import io
 import os
 import sys
 import json
+import uuid
+import hashlib
+import threading
 import tempfile
 import zipfile
 import tarfile
 from pathlib import Path
 import requests
 import subprocess
+from importlib.util import find_spec
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
 
-def create_test_package():
-    """Create a simple test package for uploading"""
-    temp_dir = Path(tempfile.mkdtemp())
-    package_dir = temp_dir / "test_package"
-    package_dir.mkdir()
-    
-    # Create setup.py
-    setup_py = package_dir / "setup.py"
-    setup_py.write_text("""
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+# httpx only speaks HTTP/2 with the optional h2 package (httpx[http2])
+HTTP2_AVAILABLE = httpx is not None and find_spec('h2') is not None
+
+# Transport-level failures of either client; anything else is a bug in
+# the tests and should surface as a traceback
+HTTP_ERRORS = (requests.RequestException,) + ((httpx.HTTPError,) if httpx is not None else ())
+
+def _quiet(*args, **kwargs):
+    """print() stand-in for --quiet"""
+
+# Progress and success output; main() swaps in _quiet for --quiet, and
+# the calls pass values as arguments so nothing is formatted in that case
+_log = print
+
+class ThreadOutput:
+    """sys.stdout stand-in that lets worker threads buffer their output"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        return (self.stream if buffer is None else buffer).write(text)
+    
+    def flush(self):
+        self.stream.flush()
+
+def run_parallel(tests):
+    """Run independent (test function, args) pairs concurrently
+    
+    Each test's output is buffered and printed in list order once all of
+    them are done, so it reads the same as a sequential run. Returns the
+    test results in list order.
+    """
+    output = ThreadOutput(sys.stdout)
+    
+    def run(test):
+        func, args = test
+        output.local.buffer = io.StringIO()
+        result = func(*args)
+        return result, output.local.buffer.getvalue()
+    
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+            results = list(executor.map(run, tests))
+    finally:
+        sys.stdout = output.stream
+    
+    for _, text in results:
+        sys.stdout.write(text)
+    return [result for result, _ in results]
+
+class MultipartFile:
+    """Streaming multipart/form-data body with a single file field
+    
+    requests sends file-like bodies in blocks as it reads them, and the
+    known length lets it set Content-Length, so the upload starts right
+    away without joining the file contents into a second body buffer.
+    """
+    
+    def __init__(self, field, filename, data):
+        self.boundary = uuid.uuid4().hex
+        head = (f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.parts = [io.BytesIO(head), io.BytesIO(data), io.BytesIO(tail)]
+        self.size = len(head) + len(data) + len(tail)
+    
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+    
+    def __len__(self):
+        return self.size
+    
+    def __iter__(self):
+        # httpx takes streaming bodies as iterables of bytes
+        return iter(lambda: self.read(1 << 16), b'')
+    
+    def read(self, size=-1):
+        chunks = []
+        while self.parts and size != 0:
+            chunk = self.parts[0].read(size)
+            if not chunk:
+                self.parts.pop(0)
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+# Sources of the test package, as the bytes that go into the archive
+SETUP_PY = b"""
 from setuptools import setup
 
 setup(
@@ -33,171 +138,248 @@ setup(
     packages=["test_package"],
     python_requires=">=3.6",
 )
-""")
-    
-    # Create package directory
-    pkg_dir = package_dir / "test_package"
-    pkg_dir.mkdir()
-    
-    # Create __init__.py
-    init_py = pkg_dir / "__init__.py"
-    init_py.write_text("""
+"""
+
+INIT_PY = b"""
 __version__ = "1.0.0"
 
 def hello():
     return "Hello from test package!"
-""")
-    
-    # Create PKG-INFO for sdist
-    pkg_info = package_dir / "PKG-INFO"
-    pkg_info.write_text("""
+"""
+
+PKG_INFO = b"""
 Name: test-package
 Version: 1.0.0
 Summary: A test package for PyPI Clone
 Author: Test Author
 Author-email: test@example.com
-""")
+"""
+
+def create_test_package():
+    """Create a simple test package for uploading
+    
+    The sdist is cached in the temp directory under a hash of its sources,
+    so later runs reuse it instead of building it again.
+    """
+    key = hashlib.blake2b(SETUP_PY + INIT_PY + PKG_INFO).hexdigest()[:16]
+    cache_dir = Path(tempfile.gettempdir()) / f"pypi_clone_test_{key}"
+    cached_path = cache_dir / "test-package-1.0.0.tar.gz"
+    
+    if cached_path.exists():
+        return str(cached_path)
     
-    # Create simple sdist
-    sdist_path = temp_dir / "test-package-1.0.0.tar.gz"
-    with tarfile.open(sdist_path, 'w:gz') as tar:
-        tar.add(package_dir, arcname="test-package-1.0.0")
+    # Archive members straight from memory, no files written to stage them
+    members = {
+        "test-package-1.0.0/setup.py": SETUP_PY,
+        "test-package-1.0.0/test_package/__init__.py": INIT_PY,
+        "test-package-1.0.0/PKG-INFO": PKG_INFO,
+    }
     
-    return str(sdist_path)
+    # Create simple sdist; the server only accepts .tar.gz, so keep gzip
+    # but at its fastest level
+    cache_dir.mkdir(exist_ok=True)
+    sdist_path = cache_dir / f"{cached_path.name}.{os.getpid()}.tmp"
+    try:
+        with tarfile.open(sdist_path, 'w:gz', compresslevel=1) as tar:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+        
+        # Move it into the cache in one step, so concurrent runs never see a
+        # partial archive
+        os.replace(sdist_path, cached_path)
+    finally:
+        # Only left over if the build failed
+        if sdist_path.exists():
+            sdist_path.unlink()
+    return str(cached_path)
 
-def test_server_basic(base_url):
+def check_server_basic(session, base_url):
     """Test basic server functionality"""
-    print("🧪 Testing basic server functionality...")
+    _log("🧪 Testing basic server functionality...")
+    
+    # Send the three probes at once; each check below waits for its own
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        homepage, simple_index, api_stats = [
+            executor.submit(session.get, url)
+            for url in (base_url, f"{base_url}/simple/", f"{base_url}/api/stats")
+        ]
     
     # Test homepage
     try:
-        response = requests.get(base_url)
-        assert response.status_code == 200, f"Homepage failed: {response.status_code}"
-        print("✅ Homepage accessible")
-    except Exception as e:
+        response = homepage.result()
+    except HTTP_ERRORS as e:
         print(f"❌ Homepage test failed: {e}")
         return False
+    if response.status_code != 200:
+        print(f"❌ Homepage failed: {response.status_code}")
+        return False
+    _log("✅ Homepage accessible")
     
     # Test simple index
     try:
-        response = requests.get(f"{base_url}/simple/")
-        assert response.status_code == 200, f"Simple index failed: {response.status_code}"
-        print("✅ Simple index accessible")
-    except Exception as e:
+        response = simple_index.result()
+    except HTTP_ERRORS as e:
         print(f"❌ Simple index test failed: {e}")
         return False
+    if response.status_code != 200:
+        print(f"❌ Simple index failed: {response.status_code}")
+        return False
+    _log("✅ Simple index accessible")
     
     # Test API stats
     try:
-        response = requests.get(f"{base_url}/api/stats")
-        assert response.status_code == 200, f"API stats failed: {response.status_code}"
-        stats = response.json()
-        assert isinstance(stats, dict), "Stats should be a dictionary"
-        print("✅ API stats working")
-    except Exception as e:
+        response = api_stats.result()
+    except HTTP_ERRORS as e:
         print(f"❌ API stats test failed: {e}")
         return False
+    if response.status_code != 200:
+        print(f"❌ API stats failed: {response.status_code}")
+        return False
+    try:
+        stats = json.loads(response.content)
+    except ValueError as e:
+        print(f"❌ API stats returned invalid JSON: {e}")
+        return False
+    if not isinstance(stats, dict):
+        print("❌ API stats test failed: Stats should be a dictionary")
+        return False
+    _log("✅ API stats working")
     
     return True
 
-def test_package_upload(base_url, package_path, username=None, password=None):
-    """Test package upload functionality"""
-    print("🧪 Testing package upload...")
+def check_package_upload(session, base_url, package_name, package_bytes):
+    """Test package upload functionality; credentials come from session.auth"""
+    _log("🧪 Testing package upload...")
     
+    body = MultipartFile('content', package_name, package_bytes)
+    # httpx calls a raw streaming body content=, requests data=
+    body_arg = 'content' if httpx is not None and isinstance(session, httpx.Client) else 'data'
+    headers = {'Content-Type': body.content_type, 'Content-Length': str(len(body))}
     try:
-        with open(package_path, 'rb') as f:
-            files = {'content': f}
-            
-            # Prepare auth if needed
-            auth = None
-            if username and password:
-                auth = (username, password)
-            
-            response = requests.post(f"{base_url}/upload", files=files, auth=auth)
-            
-            if response.status_code == 200:
-                print("✅ Package upload successful")
-                result = response.json()
-                print(f"   Uploaded: {result.get('filename')}")
-                return True
-            elif response.status_code == 401:
-                print("⚠️  Package upload requires authentication")
-                return False
-            else:
-                print(f"❌ Package upload failed: {response.status_code} - {response.text}")
-                return False
-                
-    except Exception as e:
+        response = session.post(f"{base_url}/upload", headers=headers, **{body_arg: body})
+    except HTTP_ERRORS as e:
         print(f"❌ Package upload test failed: {e}")
         return False
+    
+    if response.status_code == 200:
+        _log("✅ Package upload successful")
+        result = json.loads(response.content)
+        _log("   Uploaded:", result.get('filename'))
+        return True
+    elif response.status_code == 401:
+        print("⚠️  Package upload requires authentication")
+        return False
+    else:
+        print(f"❌ Package upload failed: {response.status_code} - {response.text}")
+        return False
 
-def test_package_download(base_url, filename):
+def check_package_download(session, base_url, filename):
     """Test package download functionality"""
-    print("🧪 Testing package download...")
+    _log("🧪 Testing package download...")
     
+    # Count the body as it arrives instead of buffering the whole file
+    url = f"{base_url}/packages/{filename}"
     try:
-        response = requests.get(f"{base_url}/packages/{filename}")
-        
-        if response.status_code == 200:
-            print("✅ Package download successful")
-            print(f"   Downloaded {len(response.content)} bytes")
-            return True
-        elif response.status_code == 404:
-            print("⚠️  Package not found (may not have been uploaded)")
-            return False
+        if httpx is not None and isinstance(session, httpx.Client):
+            with session.stream('GET', url) as response:
+                size = sum(len(chunk) for chunk in response.iter_bytes(65536))
         else:
-            print(f"❌ Package download failed: {response.status_code}")
-            return False
-            
-    except Exception as e:
+            with session.get(url, stream=True) as response:
+                size = sum(len(chunk) for chunk in response.iter_content(65536))
+    except HTTP_ERRORS as e:
         print(f"❌ Package download test failed: {e}")
         return False
+    
+    if response.status_code == 200:
+        _log("✅ Package download successful")
+        _log("   Downloaded", size, "bytes")
+        return True
+    elif response.status_code == 404:
+        print("⚠️  Package not found (may not have been uploaded)")
+        return False
+    else:
+        print(f"❌ Package download failed: {response.status_code}")
+        return False
 
-def test_search(base_url):
+def check_search(session, base_url):
     """Test package search functionality"""
-    print("🧪 Testing package search...")
+    _log("🧪 Testing package search...")
     
     try:
-        response = requests.get(f"{base_url}/search?q=test")
-        
-        if response.status_code == 200:
-            results = response.json()
-            assert isinstance(results, dict), "Search results should be a dictionary"
-            assert 'packages' in results, "Search results should contain 'packages' key"
-            print("✅ Package search working")
-            if results['packages']:
-                print(f"   Found {len(results['packages'])} package(s)")
-            return True
-        else:
-            print(f"❌ Package search failed: {response.status_code}")
-            return False
-            
-    except Exception as e:
+        response = session.get(f"{base_url}/search?q=test")
+    except HTTP_ERRORS as e:
         print(f"❌ Package search test failed: {e}")
         return False
+    
+    if response.status_code != 200:
+        print(f"❌ Package search failed: {response.status_code}")
+        return False
+    
+    try:
+        results = json.loads(response.content)
+    except ValueError as e:
+        print(f"❌ Package search returned invalid JSON: {e}")
+        return False
+    if not isinstance(results, dict):
+        print("❌ Package search test failed: Search results should be a dictionary")
+        return False
+    if 'packages' not in results:
+        print("❌ Package search test failed: Search results should contain 'packages' key")
+        return False
+    
+    _log("✅ Package search working")
+    if results['packages']:
+        _log("   Found", len(results['packages']), "package(s)")
+    return True
 
-def test_pip_compatibility(base_url):
+def check_pip_compatibility(session, base_url):
     """Test pip compatibility"""
-    print("🧪 Testing pip compatibility...")
+    _log("🧪 Testing pip compatibility...")
     
+    # Test simple index format
     try:
-        # Test simple index format
-        response = requests.get(f"{base_url}/simple/")
-        if response.status_code != 200:
-            print(f"❌ Simple index not accessible: {response.status_code}")
-            return False
-        
-        content = response.text
-        if '<a href=' not in content and 'Simple index' in content:
-            print("✅ Simple index format looks correct")
-            return True
-        else:
-            print("⚠️  Simple index format may not be pip-compatible")
-            return False
-            
-    except Exception as e:
+        response = session.get(f"{base_url}/simple/")
+    except HTTP_ERRORS as e:
         print(f"❌ Pip compatibility test failed: {e}")
         return False
+    if response.status_code != 200:
+        print(f"❌ Simple index not accessible: {response.status_code}")
+        return False
+    
+    # Byte checks; decoding the page as text would mean charset detection
+    content = response.content
+    if b'<a href=' not in content and b'Simple index' in content:
+        _log("✅ Simple index format looks correct")
+        return True
+    else:
+        print("⚠️  Simple index format may not be pip-compatible")
+        return False
+
+def open_session(base_url, username=None, password=None):
+    """HTTP client shared by every test
+    
+    With httpx and h2 installed, https servers are tested over HTTP/2 so
+    the concurrent tests share one multiplexed connection (HTTP/2 is
+    negotiated during the TLS handshake, so plain http stays on HTTP/1.1).
+    Otherwise a requests.Session with a pool of kept-alive connections.
+    Credentials are attached to the client once rather than per request.
+    """
+    auth = None
+    if HTTP2_AVAILABLE and base_url.startswith('https://'):
+        if username and password:
+            auth = httpx.BasicAuth(username, password)
+        return httpx.Client(http2=True, auth=auth, limits=httpx.Limits(max_keepalive_connections=10))
+    
+    session = requests.Session()
+    if username and password:
+        session.auth = HTTPBasicAuth(username, password)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 def run_tests(base_url="http://localhost:8080", username=None, password=None):
     """Run all tests"""
@@ -205,71 +387,105 @@ def run_tests(base_url="http://localhost:8080", username=None, password=None):
     print(f"📍 Testing server at: {base_url}")
     print("=" * 50)
     
-    tests_passed = 0
-    total_tests = 0
+    # One client for every test, so requests reuse their connections
+    with open_session(base_url, username, password) as session:
+        tests_passed, total_tests = run_test_cases(session, base_url)
     
-    # Test basic functionality
-    total_tests += 1
-    if test_server_basic(base_url):
-        tests_passed += 1
+    print("\n" + "=" * 50)
+    print(f"📊 Test Results: {tests_passed}/{total_tests} tests passed")
     
+    if tests_passed == total_tests:
+        print("🎉 All tests passed! PyPI Clone is working correctly.")
+        return True
+    else:
+        print("⚠️  Some tests failed. Check the output above for details.")
+        return False
+
+def run_test_cases(session, base_url):
+    """Run the test cases over session; returns (passed, total)"""
     # Create test package
-    print("\n📦 Creating test package...")
+    _log("📦 Creating test package...")
     package_path = create_test_package()
     package_filename = Path(package_path).name
-    print(f"   Created: {package_filename}")
+    # Read once; retried or repeated uploads reuse the same buffer
+    package_bytes = Path(package_path).read_bytes()
+    _log("   Created:", package_filename, end="\n\n")
     
-    # Test package upload
-    total_tests += 1
-    upload_success = test_package_upload(base_url, package_path, username, password)
-    if upload_success:
-        tests_passed += 1
+    # Test basic functionality and package upload; they do not depend on
+    # each other
+    basic_success, upload_success = run_parallel([
+        (check_server_basic, (session, base_url)),
+        (check_package_upload, (session, base_url, package_filename, package_bytes)),
+    ])
     
-    # Test package download (only if upload succeeded)
+    # Test package download (only if upload succeeded), search and pip
+    # compatibility; these run after the upload so they can see it
+    stage = []
     if upload_success:
-        total_tests += 1
-        if test_package_download(base_url, package_filename):
-            tests_passed += 1
+        stage.append((check_package_download, (session, base_url, package_filename)))
+    stage.append((check_search, (session, base_url)))
+    stage.append((check_pip_compatibility, (session, base_url)))
+    results = [basic_success, upload_success] + run_parallel(stage)
     
-    # Test search
-    total_tests += 1
-    if test_search(base_url):
-        tests_passed += 1
+    tests_passed = sum(1 for result in results if result)
+    total_tests = len(results)
     
-    # Test pip compatibility
-    total_tests += 1
-    if test_pip_compatibility(base_url):
-        tests_passed += 1
+    # The sdist stays in its cache for the next run
+    return tests_passed, total_tests
+
+if pytest is not None:
+    # pytest entry points over the same checks, e.g.
+    #   PYPI_TEST_URL=http://localhost:8080 pytest -n auto test_server.py
+    # Session fixtures are per process, so each xdist worker gets its own
+    # connection pool; the upload and download share a test, as the
+    # download needs the file the upload stored
     
-    # Clean up
-    try:
-        os.unlink(package_path)
-        os.rmdir(Path(package_path).parent)
-    except:
-        pass
+    @pytest.fixture(scope='session')
+    def base_url():
+        return os.getenv('PYPI_TEST_URL', 'http://localhost:8080')
     
-    print("\n" + "=" * 50)
-    print(f"📊 Test Results: {tests_passed}/{total_tests} tests passed")
+    @pytest.fixture(scope='session')
+    def credentials():
+        return os.getenv('PYPI_TEST_USERNAME'), os.getenv('PYPI_TEST_PASSWORD')
     
-    if tests_passed == total_tests:
-        print("🎉 All tests passed! PyPI Clone is working correctly.")
-        return True
-    else:
-        print("⚠️  Some tests failed. Check the output above for details.")
-        return False
+    @pytest.fixture(scope='session')
+    def http_session(base_url, credentials):
+        with open_session(base_url, *credentials) as session:
+            yield session
+    
+    def test_server_basic(http_session, base_url):
+        assert check_server_basic(http_session, base_url)
+    
+    def test_package_upload_and_download(http_session, base_url):
+        package_path = Path(create_test_package())
+        assert check_package_upload(http_session, base_url, package_path.name,
+                                    package_path.read_bytes())
+        assert check_package_download(http_session, base_url, package_path.name)
+    
+    def test_search(http_session, base_url):
+        assert check_search(http_session, base_url)
+    
+    def test_pip_compatibility(http_session, base_url):
+        assert check_pip_compatibility(http_session, base_url)
 
 def main():
     """Main test runner"""
     import argparse
+    global _log
     
     parser = argparse.ArgumentParser(description="Test PyPI Clone server")
     parser.add_argument('--url', default='http://localhost:8080', 
                        help='Base URL of PyPI server (default: http://localhost:8080)')
     parser.add_argument('--username', help='Username for authentication')
     parser.add_argument('--password', help='Password for authentication')
+    parser.add_argument('--quiet', action='store_true',
+                       help='Only print failures and the summary')
     
     args = parser.parse_args()
     
+    if args.quiet:
+        _log = _quiet
+    
     success = run_tests(args.url, args.username, args.password)
     sys.exit(0 if success else 1)
 